@@ -1,6 +1,6 @@
 import tempfile
 from pathlib import Path, PurePath
-from statistics import mean
+from math import fsum
 from typing import List, Set, cast
 
 import pandas as pd
@@ -66,17 +66,21 @@ def compute_alignment_score(
     for i in unaligned_src_indices:
         probs.append(max(inverse_lexicon["NULL", src_words[i]], 1e-9))
 
-    return mean(probs) if len(probs) > 0 else 0
+    # statistics.mean() sums the probabilities as exact fractions, which dominates the cost of scoring large corpora
+    return fsum(probs) / len(probs) if len(probs) > 0 else 0
 
 
 def add_alignment_scores(corpus: pd.DataFrame, aligner_id: str = "fast_align") -> None:
+    corpus["score"] = get_alignment_scores(corpus, aligner_id)
+
+
+def get_alignment_scores(corpus: pd.DataFrame, aligner_id: str = "fast_align") -> List[float]:
     with tempfile.TemporaryDirectory() as td:
         src_path = Path(td) / "src-input.txt"
         trg_path = Path(td) / "trg-input.txt"
         write_corpus(src_path, corpus["source"])
         write_corpus(trg_path, corpus["target"])
-        scores = compute_alignment_scores(src_path, trg_path, aligner_id)
-        corpus["score"] = scores
+        return compute_alignment_scores(src_path, trg_path, aligner_id)
 
 
 def compute_alignment_scores(
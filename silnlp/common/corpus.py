@@ -1,22 +1,37 @@
+import codecs
 import itertools
+import math
+import mmap
+import multiprocessing
+import os
 import random
+from collections import deque
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from multiprocessing.pool import AsyncResult
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from machine.corpora import TextFileTextCorpus
 from machine.scripture import ORIGINAL_VERSIFICATION, VerseRef
 from machine.tokenization import LatinWordTokenizer
-from sklearn.model_selection import train_test_split
 
 from .environment import SIL_NLP_ENV
 
 
+_WRITE_CHUNK_SIZE = 10000
+
+
 def write_corpus(corpus_path: Path, sentences: Iterable[str], append: bool = False) -> None:
-    with corpus_path.open("a" if append else "w", encoding="utf-8", newline="\n") as file:
-        for sentence in sentences:
-            file.write(sentence + "\n")
+    with corpus_path.open("ab" if append else "wb") as file:
+        it = iter(sentences)
+        while True:
+            chunk = list(itertools.islice(it, _WRITE_CHUNK_SIZE))
+            if len(chunk) == 0:
+                break
+            file.write(("\n".join(chunk) + "\n").encode("utf-8"))
 
 
 def load_corpus(corpus_path: Path) -> Iterator[str]:
@@ -26,6 +41,71 @@ def load_corpus(corpus_path: Path) -> Iterator[str]:
             yield line
 
 
+_ASCII_WHITESPACE = np.zeros(256, dtype=bool)
+_ASCII_WHITESPACE[list(b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f")] = True
+
+
+def get_nonempty_line_mask(corpus_path: Path) -> np.ndarray:
+    with corpus_path.open("rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return np.zeros(0, dtype=bool)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            cr_indices = np.flatnonzero(data == 13)
+            if np.any(cr_indices + 1 == len(data)) or np.any(data[cr_indices[cr_indices + 1 < len(data)] + 1] != 10):
+                # lone carriage returns are line breaks in text mode, so fall back to reading the lines as text
+                del data
+                with corpus_path.open("r", encoding="utf-8") as text_file:
+                    return np.array([len(line.strip()) > 0 for line in text_file], dtype=bool)
+
+            line_starts = np.concatenate(([0], np.flatnonzero(data == 10) + 1))
+            if line_starts[-1] == len(data):
+                line_starts = line_starts[:-1]
+            has_text = np.logical_or.reduceat(~_ASCII_WHITESPACE[data] & (data < 128), line_starts)
+            has_non_ascii = np.logical_or.reduceat(data >= 128, line_starts)
+            line_ends = np.append(line_starts[1:], len(data))
+            # lines that only contain non-ASCII characters and whitespace are decoded to check for Unicode whitespace
+            for i in np.flatnonzero(~has_text & has_non_ascii):
+                has_text[i] = len(bytes(data[line_starts[i] : line_ends[i]]).decode("utf-8").strip()) > 0
+            del data
+    return has_text
+
+
+def sample_corpus_lines(file_paths: List[Path], sample_size: int, seed: Optional[int]) -> Optional[List[str]]:
+    # returns a random sample of the nonempty lines, or None if all of the lines should be used
+    if sample_size <= 0:
+        return None
+    # the nonempty lines are counted without decoding the files, so the lines only need to be read if they are sampled
+    line_indices = [np.flatnonzero(get_nonempty_line_mask(file_path)) for file_path in file_paths]
+    count = sum(len(indices) for indices in line_indices)
+    if count <= sample_size:
+        return None
+
+    rng = random.Random(seed)
+    selected = np.sort(np.array(rng.sample(range(count), sample_size), dtype=np.int64))
+    sample: List[str] = []
+    offset = 0
+    for file_path, indices in zip(file_paths, line_indices):
+        file_selected = selected[(selected >= offset) & (selected < offset + len(indices))] - offset
+        offset += len(indices)
+        if len(file_selected) == 0:
+            continue
+        keep = np.zeros(indices[file_selected[-1]] + 1, dtype=bool)
+        keep[indices[file_selected]] = True
+        with file_path.open("r", encoding="utf-8") as file:
+            for line, keep_line in zip(file, keep.tolist()):
+                if keep_line:
+                    sample.append(line if line.endswith("\n") else line + "\n")
+    return sample
+
+
+def write_unique_lines(file_paths: Iterable[Path], output_path: Path) -> int:
+    # the lines are stripped, so lines that only differ in surrounding whitespace are the same
+    lines = dict.fromkeys(line for file_path in file_paths for line in load_corpus(file_path) if len(line) > 0)
+    write_corpus(output_path, lines)
+    return len(lines)
+
+
 def tokenize_corpus(input_path: Path, output_path: Path) -> None:
     corpus = TextFileTextCorpus(input_path).tokenize(LatinWordTokenizer()).escape_spaces().nfc_normalize().lowercase()
     with output_path.open("w", encoding="utf-8", newline="\n") as output_stream, corpus.get_rows() as rows:
@@ -33,6 +113,22 @@ def tokenize_corpus(input_path: Path, output_path: Path) -> None:
             output_stream.write(row.text + "\n")
 
 
+def _load_stripped_lines(corpus_path: Path) -> Tuple[str, ...]:
+    stat = corpus_path.stat()
+    return _load_stripped_lines_cached(corpus_path, stat.st_mtime_ns, stat.st_size)
+
+
+# scripture files (vref.txt in particular) are paired with many other files, so only read each one once
+@lru_cache(maxsize=16)
+def _load_stripped_lines_cached(corpus_path: Path, mtime_ns: int, size: int) -> Tuple[str, ...]:
+    with corpus_path.open("r", encoding="utf-8") as file:
+        return tuple(line.strip() for line in file)
+
+
+def load_vref_lines() -> Tuple[str, ...]:
+    return _load_stripped_lines(SIL_NLP_ENV.assets_dir / "vref.txt")
+
+
 def get_scripture_parallel_corpus(
     src_file_path: Path, trg_file_path: Path, remove_empty_sentences: bool = True
 ) -> pd.DataFrame:
@@ -40,41 +136,38 @@ def get_scripture_parallel_corpus(
     src_sentences: List[str] = []
     trg_sentences: List[str] = []
     indices: List[int] = []
-    with (SIL_NLP_ENV.assets_dir / "vref.txt").open("r", encoding="utf-8") as vref_file, src_file_path.open(
-        "r", encoding="utf-8"
-    ) as src_file, trg_file_path.open("r", encoding="utf-8") as trg_file:
-        index = 0
-        for vref_line, src_line, trg_line in zip(vref_file, src_file, trg_file):
-            vref_line = vref_line.strip()
-            src_line = src_line.strip()
-            trg_line = trg_line.strip()
-            vref = VerseRef.from_string(vref_line, ORIGINAL_VERSIFICATION)
-            if src_line == "<range>" and trg_line == "<range>":
-                if vref.chapter_num == vrefs[-1].chapter_num:
-                    vrefs[-1].simplify()
-                    vrefs[-1] = VerseRef.from_range(vrefs[-1], vref)
-            elif src_line == "<range>":
-                if vref.chapter_num == vrefs[-1].chapter_num:
-                    vrefs[-1].simplify()
-                    vrefs[-1] = VerseRef.from_range(vrefs[-1], vref)
-                if len(trg_line) > 0:
-                    if len(trg_sentences[-1]) > 0:
-                        trg_sentences[-1] += " "
-                    trg_sentences[-1] += trg_line
-            elif trg_line == "<range>":
-                if vref.chapter_num == vrefs[-1].chapter_num:
-                    vrefs[-1].simplify()
-                    vrefs[-1] = VerseRef.from_range(vrefs[-1], vref)
-                if len(src_line) > 0:
-                    if len(src_sentences[-1]) > 0:
-                        src_sentences[-1] += " "
-                    src_sentences[-1] += src_line
-            else:
-                vrefs.append(vref)
-                src_sentences.append(src_line)
-                trg_sentences.append(trg_line)
-                indices.append(index)
-            index += 1
+    vref_lines = load_vref_lines()
+    src_lines = _load_stripped_lines(src_file_path)
+    trg_lines = _load_stripped_lines(trg_file_path)
+    index = 0
+    for vref_line, src_line, trg_line in zip(vref_lines, src_lines, trg_lines):
+        vref = VerseRef.from_string(vref_line, ORIGINAL_VERSIFICATION)
+        if src_line == "<range>" and trg_line == "<range>":
+            if vref.chapter_num == vrefs[-1].chapter_num:
+                vrefs[-1].simplify()
+                vrefs[-1] = VerseRef.from_range(vrefs[-1], vref)
+        elif src_line == "<range>":
+            if vref.chapter_num == vrefs[-1].chapter_num:
+                vrefs[-1].simplify()
+                vrefs[-1] = VerseRef.from_range(vrefs[-1], vref)
+            if len(trg_line) > 0:
+                if len(trg_sentences[-1]) > 0:
+                    trg_sentences[-1] += " "
+                trg_sentences[-1] += trg_line
+        elif trg_line == "<range>":
+            if vref.chapter_num == vrefs[-1].chapter_num:
+                vrefs[-1].simplify()
+                vrefs[-1] = VerseRef.from_range(vrefs[-1], vref)
+            if len(src_line) > 0:
+                if len(src_sentences[-1]) > 0:
+                    src_sentences[-1] += " "
+                src_sentences[-1] += src_line
+        else:
+            vrefs.append(vref)
+            src_sentences.append(src_line)
+            trg_sentences.append(trg_line)
+            indices.append(index)
+        index += 1
 
     if remove_empty_sentences:
         for i in range(len(vrefs) - 1, -1, -1):
@@ -93,6 +186,31 @@ def get_scripture_parallel_corpus(
     return pd.DataFrame(data, index=indices)
 
 
+def _load_scripture_parallel_corpus(file_paths: Tuple[Path, Path]) -> pd.DataFrame:
+    src_file_path, trg_file_path = file_paths
+    return get_scripture_parallel_corpus(src_file_path, trg_file_path)
+
+
+def load_scripture_parallel_corpora(file_paths: List[Tuple[Path, Path]]) -> Iterator[pd.DataFrame]:
+    process_count = min(len(file_paths), multiprocessing.cpu_count() // 2)
+    if process_count <= 1:
+        yield from map(_load_scripture_parallel_corpus, file_paths)
+        return
+
+    # the corpora are loaded in worker processes, but they are returned in order, so that the rest of the
+    # preprocessing (which depends on the random seed) is unchanged. Only a bounded number of corpora are loaded ahead
+    # of the consumer, so that the corpora do not pile up in memory.
+    max_pending = process_count * 2
+    with multiprocessing.Pool(process_count) as pool:
+        pending: Deque[AsyncResult] = deque()
+        for paths in file_paths:
+            if len(pending) == max_pending:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(_load_scripture_parallel_corpus, (paths,)))
+        while len(pending) > 0:
+            yield pending.popleft().get()
+
+
 def get_mt_corpus_path(corpus: str) -> Path:
     corpus_path = SIL_NLP_ENV.mt_corpora_dir / f"{corpus}.txt"
     if corpus_path.is_file():
@@ -100,6 +218,61 @@ def get_mt_corpus_path(corpus: str) -> Path:
     return SIL_NLP_ENV.mt_scripture_dir / f"{corpus}.txt"
 
 
+def combine_eval_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    # equivalent to folding the frames with combine_first() and fillna(""), but each frame is only merged into
+    # dicts, instead of realigning the whole data set for every frame
+    return _combine_frames(frames, fill_each_step=True)
+
+
+def combine_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    # equivalent to folding the frames with combine_first() and calling fillna("") on the result
+    return _combine_frames(frames, fill_each_step=False)
+
+
+def _combine_frames(frames: List[pd.DataFrame], fill_each_step: bool) -> pd.DataFrame:
+    first = frames[0]
+    if len(frames) == 1:
+        return first
+
+    index: List[Any] = first.index.tolist()
+    columns: List[str] = first.columns.tolist()
+    sort_index = False
+    sort_columns = False
+    rows: Set[Any] = set(index)
+    data: Dict[str, Dict[Any, Any]] = {c: dict(zip(index, first[c].tolist())) for c in columns}
+    for frame in frames[1:]:
+        frame_index: List[Any] = frame.index.tolist()
+        frame_columns: List[str] = frame.columns.tolist()
+        # pandas keeps the existing order if both axes are identical, otherwise the union is sorted
+        sort_index = sort_index or frame_index != index
+        sort_columns = sort_columns or frame_columns != columns
+        for column in frame_columns:
+            values = frame[column].tolist()
+            column_data = data.get(column)
+            if column_data is None:
+                data[column] = dict(zip(frame_index, values))
+            elif fill_each_step:
+                # existing cells (including the ones filled with "") take precedence
+                for i, value in zip(frame_index, values):
+                    if i not in rows:
+                        column_data[i] = value
+            else:
+                # only missing cells are filled
+                for i, value in zip(frame_index, values):
+                    column_data.setdefault(i, value)
+        rows.update(frame_index)
+
+    final_index = sorted(rows) if sort_index else index
+    final_columns = sorted(data) if sort_columns else columns
+    return pd.DataFrame(
+        {c: [data[c].get(i, "") for i in final_index] for c in final_columns},
+        index=pd.MultiIndex.from_tuples(final_index, names=first.index.names)
+        if isinstance(first.index, pd.MultiIndex)
+        else pd.Index(final_index, name=first.index.name),
+        columns=final_columns,
+    )
+
+
 def split_parallel_corpus(
     corpus: pd.DataFrame, split_size: Union[float, int], split_indices: Set[int] = None
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
@@ -111,9 +284,12 @@ def split_parallel_corpus(
             split = corpus
             corpus = pd.DataFrame(columns=corpus.columns)
         else:
-            corpus, split = train_test_split(corpus, test_size=split_size)
-            corpus = corpus.copy()
-            split = split.copy()
+            # draws the same permutation from the global random state as sklearn's train_test_split
+            split_count = math.ceil(split_size * len(corpus)) if split_size < 1 else int(split_size)
+            permutation = np.random.permutation(len(corpus))
+            # take() makes a single copy that is not flagged as a slice of the original
+            split = corpus.take(permutation[:split_count])
+            corpus = corpus.take(permutation[split_count:])
     else:
         split = corpus.filter(split_indices, axis=0)
         corpus.drop(split_indices, inplace=True, errors="ignore")
@@ -135,13 +311,19 @@ def filter_parallel_corpus(corpus: pd.DataFrame, score_threshold: float) -> pd.D
 def split_corpus(corpus_size: int, split_size: Union[float, int], used_indices: Set[int] = set()) -> Optional[Set[int]]:
     if isinstance(split_size, float):
         split_size = int(split_size if split_size > 1 else corpus_size * split_size)
-    population = (
-        range(corpus_size) if len(used_indices) == 0 else [i for i in range(corpus_size) if i not in used_indices]
-    )
-    if split_size >= len(population):
+    if len(used_indices) == 0:
+        if split_size >= corpus_size:
+            return None
+        return set(random.sample(range(corpus_size), split_size))
+
+    # sample positions in the unused indices, instead of building the list of unused indices, and then map each
+    # position to its index. random.sample() only depends on the size of the population, so the result is the same.
+    used = np.array(sorted(used_indices), dtype=np.int64)
+    if split_size >= corpus_size - len(used):
         return None
-
-    return set(random.sample(population, split_size))
+    positions = np.array(random.sample(range(corpus_size - len(used)), split_size), dtype=np.int64)
+    indices = positions + np.searchsorted(used - np.arange(len(used)), positions, side="right")
+    return set(indices.tolist())
 
 
 def get_scripture_path(iso: str, project: str) -> Path:
@@ -277,6 +459,38 @@ def get_terms_data_frame(
     return pd.DataFrame(data, columns=["rendering", "gloss", "dictionary", "vrefs"])
 
 
-def count_lines(file_path: Path, line_filter: Callable[[str], bool] = lambda l: True) -> int:
+def count_lines(file_path: Path, line_filter: Optional[Callable[[str], bool]] = None) -> int:
+    if line_filter is None:
+        count = _count_newlines(file_path)
+        if count is not None:
+            return count
     with file_path.open("r", encoding="utf-8-sig") as file:
-        return sum(1 for l in file if line_filter(l))
+        return sum(1 for l in file if line_filter is None or line_filter(l))
+
+
+_READ_CHUNK_SIZE = 1 << 20
+
+
+def _count_newlines(file_path: Path) -> Optional[int]:
+    # counts the lines without decoding them, returns None if there are lone carriage returns, since those are also
+    # line breaks in text mode
+    newline_count = 0
+    cr_count = 0
+    crlf_count = 0
+    last_byte = b""
+    with file_path.open("rb") as file:
+        if file.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+            file.seek(0)
+        while True:
+            chunk = file.read(_READ_CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            newline_count += chunk.count(b"\n")
+            cr_count += chunk.count(b"\r")
+            crlf_count += chunk.count(b"\r\n")
+            if last_byte == b"\r" and chunk.startswith(b"\n"):
+                crlf_count += 1
+            last_byte = chunk[-1:]
+    if cr_count != crlf_count:
+        return None
+    return newline_count if last_byte in (b"", b"\n") else newline_count + 1
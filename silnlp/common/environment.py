@@ -23,6 +23,10 @@ class SilNlpEnv:
         self.assets_dir = Path(__file__).parent.parent / "assets"
         self.is_bucket = False
 
+        # trained SentencePiece models are reused across experiments, if a cache directory is specified
+        sp_cache_dir = os.getenv("SIL_NLP_SP_CACHE_DIR")
+        self.sp_cache_dir = None if sp_cache_dir is None else Path(sp_cache_dir)
+
         # Root data directory
         self.set_data_dir()
 
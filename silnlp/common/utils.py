@@ -1,11 +1,17 @@
+import itertools
 import logging
 import os
+import queue
 import random
 import subprocess
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from enum import Flag
 from pathlib import Path
-from typing import Any, List, Optional, Set
+from typing import Any, Iterable, Iterator, List, Optional, Set, TypeVar, Union
 
 import numpy as np
 
@@ -13,6 +19,8 @@ from ..common.environment import SIL_NLP_ENV
 
 LOGGER = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 def get_repo_dir() -> Path:
     script_path = Path(__file__)
@@ -58,6 +66,70 @@ def unique_list(seq: List[str]) -> List[str]:
     return [x for x in seq if not (x in seen or seen_add(x))]
 
 
+def prefetch(iterable: Iterable[T], chunk_size: int = 1000, max_chunks: int = 8) -> Iterator[T]:
+    # items are read ahead in chunks on a background thread, so that I/O overlaps with processing the items
+    chunks: "queue.Queue[Union[List[T], BaseException, None]]" = queue.Queue(max_chunks)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            it = iter(iterable)
+            while not stop.is_set():
+                chunk = list(itertools.islice(it, chunk_size))
+                if len(chunk) == 0:
+                    break
+                chunks.put(chunk)
+            chunks.put(None)
+        except BaseException as e:
+            chunks.put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield from chunk
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                thread.join(0.01)
+
+
+def _get_max_rss_mb() -> Optional[float]:
+    # the resource module is not available on Windows
+    if sys.platform == "win32":
+        return None
+    import resource
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # the peak resident set size is in bytes on macOS and in kilobytes elsewhere
+    return max_rss / (1 << 20) if sys.platform == "darwin" else max_rss / (1 << 10)
+
+
+@contextmanager
+def log_elapsed(logger: logging.Logger, phase: str) -> Iterator[None]:
+    # logs the wall-clock time of a phase, so that slow phases can be found with "grep elapsed=", along with the CPU
+    # time of this process (a ratio near 1 means the phase is compute-bound) and the peak memory usage so far
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        message = f"phase={phase} elapsed={elapsed:.2f}s cpu={time.process_time() - start_cpu:.2f}s"
+        max_rss_mb = _get_max_rss_mb()
+        if max_rss_mb is not None:
+            message += f" max_rss={max_rss_mb:.0f}MB"
+        logger.info(message)
+
+
 def is_set(value: Flag, flag: Flag) -> bool:
     return (value & flag) == flag
 
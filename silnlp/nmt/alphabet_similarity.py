@@ -79,9 +79,7 @@ def computeSimilarity(projects: List[str]) -> None:
 
 
 def get_iso(file_path: Path) -> str:
-    file_name = file_path.name
-    parts = file_name.split("-")
-    return parts[0]
+    return file_path.name.partition("-")[0]
 
 
 def main() -> None:
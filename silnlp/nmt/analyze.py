@@ -25,7 +25,14 @@ from ..common.utils import get_git_revision_hash
 from .config import Config, create_model, load_config, set_tf_log_level
 from .runner import make_inference_dataset
 from .models.sil_transformer import SILTransformer
-from .utils import decode_sp, encode_sp, get_best_model_dir, get_last_checkpoint, enable_memory_growth
+from .utils import (
+    decode_sp,
+    enable_memory_growth,
+    encode_sp,
+    get_best_model_dir,
+    get_last_checkpoint,
+    get_trg_tag_iso,
+)
 
 
 def create_test_dataset(config: Config) -> lit_dataset.Dataset:
@@ -74,12 +81,7 @@ def create_test_dataset(config: Config) -> lit_dataset.Dataset:
                 for lines in zip(src_file, vref_file, *ref_files):
                     src_line = lines[0].strip()
                     vref_line = lines[1].strip()
-                    trg_iso = default_trg_iso
-                    if src_line.startswith("<2"):
-                        index = src_line.index(">")
-                        val = src_line[2:index]
-                        if val != "qaa":
-                            trg_iso = val
+                    trg_iso = get_trg_tag_iso(src_line, default_trg_iso)
                     example: lit_types.JsonDict = {
                         "vref": vref_line,
                         "src_text": decode_sp(src_line),
@@ -113,12 +115,7 @@ def create_train_dataset(config: Config) -> lit_dataset.Dataset:
             src_iso = default_src_iso
             if len(config.src_isos) > 1:
                 src_iso = "?"
-            trg_iso = default_trg_iso
-            if src_line.startswith("<2"):
-                index = src_line.index(">")
-                val = src_line[2:index]
-                if val != "qaa":
-                    trg_iso = val
+            trg_iso = get_trg_tag_iso(src_line, default_trg_iso)
             example: lit_types.JsonDict = {
                 "vref": "?",
                 "src_text": decode_sp(src_line),
@@ -1,17 +1,22 @@
 import argparse
+import filecmp
+import hashlib
 import itertools
 import logging
+import multiprocessing
 import os
 import random
 import shutil
 import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import ExitStack
 from dataclasses import dataclass, field
 from enum import Enum, Flag, auto
 from pathlib import Path
-from statistics import mean
-from typing import Any, Dict, Iterable, List, Optional, Set, TextIO, Tuple, Type, Union, cast
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Type, Union, cast
 
+import numpy as np
 import pandas as pd
 import sentencepiece as sp
 import tensorflow as tf
@@ -25,12 +30,14 @@ from tqdm import tqdm
 
 from ..alignment.config import get_aligner, get_aligner_name
 from ..alignment.machine_aligner import MachineAligner
-from ..alignment.utils import add_alignment_scores
+from ..alignment.utils import get_alignment_scores
 from ..common.corpus import (
+    combine_eval_frames,
+    combine_frames,
     exclude_books,
     filter_parallel_corpus,
     get_mt_corpus_path,
-    get_scripture_parallel_corpus,
+    get_nonempty_line_mask,
     get_terms,
     get_terms_corpus,
     get_terms_data_frame,
@@ -39,9 +46,12 @@ from ..common.corpus import (
     get_terms_renderings_path,
     include_books,
     load_corpus,
+    load_scripture_parallel_corpora,
+    sample_corpus_lines,
     split_corpus,
     split_parallel_corpus,
     write_corpus,
+    write_unique_lines,
 )
 from ..common.environment import SIL_NLP_ENV, download_if_s3_paths
 from ..common.utils import (
@@ -52,13 +62,15 @@ from ..common.utils import (
     get_git_revision_hash,
     get_mt_exp_dir,
     is_set,
+    log_elapsed,
     merge_dict,
+    prefetch,
     set_seed,
 )
 from .augment import AugmentMethod, create_augment_methods
 from .models.sil_transformer import SILTransformer
 from .runner import SILRunner
-from .utils import decode_sp, decode_sp_lines, encode_sp, encode_sp_lines, get_best_model_dir, get_last_checkpoint
+from .utils import encode_sp, encode_sp_lines, get_best_model_dir, get_last_checkpoint, normalize_sp_lines
 
 _PYTHON_TO_TENSORFLOW_LOGGING_LEVEL: Dict[int, int] = {
     logging.CRITICAL: 3,
@@ -94,6 +106,16 @@ _DEFAULT_NEW_CONFIG: dict = {
 
 BASIC_DATA_PROJECT = "BASIC"
 
+_EVAL_SENTENCE_BATCH_SIZE = 10000
+# the basic data sets are written a line at a time to many files at once, so each file gets a larger buffer
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# the data set that each line of a basic data file pair is written to
+_NO_SPLIT = 0
+_TEST_SPLIT = 1
+_VAL_SPLIT = 2
+_TRAIN_SPLIT = 3
+
 
 # Different types of parent model checkpoints (last, best, average)
 class CheckpointType(Enum):
@@ -124,11 +146,13 @@ class DataFile:
 
     def __post_init__(self):
         file_name = self.path.stem
-        parts = file_name.split("-")
-        if len(parts) < 2:
+        iso, sep, rest = file_name.partition("-")
+        if sep == "":
             raise RuntimeError(f"The filename {file_name} needs to be of the format <iso>-<project>")
-        self.iso = parts[0]
-        self.project = parts[1] if self.path.parent == SIL_NLP_ENV.mt_scripture_dir else BASIC_DATA_PROJECT
+        self.iso = iso
+        self.project = (
+            rest.partition("-")[0] if self.path.parent == SIL_NLP_ENV.mt_scripture_dir else BASIC_DATA_PROJECT
+        )
 
     @property
     def is_scripture(self) -> bool:
@@ -337,30 +361,31 @@ def get_terms_glosses_file_paths(terms_files: List[DataFile]) -> Set[Path]:
 
 
 def get_parallel_corpus_size(src_file_path: Path, trg_file_path: Path) -> int:
-    count = 0
-    with src_file_path.open("r", encoding="utf-8") as src_file, trg_file_path.open("r", encoding="utf-8") as trg_file:
-        for src_line, trg_line in zip(src_file, trg_file):
-            src_line = src_line.strip()
-            trg_line = trg_line.strip()
-            if len(src_line) > 0 and len(trg_line) > 0:
-                count += 1
-    return count
+    src_mask = get_nonempty_line_mask(src_file_path)
+    trg_mask = get_nonempty_line_mask(trg_file_path)
+    length = min(len(src_mask), len(trg_mask))
+    return int(np.count_nonzero(src_mask[:length] & trg_mask[:length]))
 
 
 def convert_vocab(sp_vocab_path: Path, onmt_vocab_path: Path, tags: Set[str]) -> None:
     special_tokens = [START_OF_SENTENCE_TOKEN, END_OF_SENTENCE_TOKEN, PADDING_TOKEN] + list(tags)
 
-    vocab = Vocab(special_tokens)
-    with sp_vocab_path.open("r", encoding="utf-8") as vocab_file:
-        for line in vocab_file:
-            token = line.rstrip("\r\n")
-            index = token.rindex("\t")
-            token = token[:index]
-            if token in ("<unk>", "<s>", "</s>", "<blank>"):  # Ignore special tokens
-                continue
-            vocab.add(token)
-    vocab.pad_to_multiple(8)
-    vocab.serialize(onmt_vocab_path)
+    # an insertion-ordered dict is used as the vocab, which is written in the same format as Vocab.serialize
+    vocab: Dict[str, None] = dict.fromkeys(special_tokens)
+    # the vocab file is read all at once and split on "\n" only, since SentencePiece pieces can contain other
+    # characters that str.splitlines() treats as line breaks
+    sp_special_tokens = {"<unk>", "<s>", "</s>", "<blank>"}
+    for line in sp_vocab_path.read_text(encoding="utf-8").split("\n"):
+        token = line.rpartition("\t")[0]
+        if token == "" or token in sp_special_tokens:  # Ignore special tokens
+            continue
+        vocab[token] = None
+    # pad the vocab (plus the OOV token) to a multiple of 8, like Vocab.pad_to_multiple
+    i = 0
+    while (len(vocab) + 1) % 8 != 0:
+        vocab.setdefault(f"averyunlikelytoken{i}")
+        i += 1
+    onmt_vocab_path.write_bytes("".join(token + "\n" for token in vocab).encode("utf-8"))
 
 
 def build_vocab(
@@ -375,6 +400,9 @@ def build_vocab(
     vocab_path: Path,
     tags: Set[str],
     max_train_size: int,
+    num_threads: int = 16,
+    cache_dir: Optional[Path] = None,
+    dedup_lines: bool = False,
 ) -> None:
     casing = casing.lower()
     normalization: str
@@ -392,24 +420,88 @@ def build_vocab(
     file_paths = download_if_s3_paths(file_paths)
     file_paths.sort()
 
+    cache_path: Optional[Path] = None
+    if cache_dir is not None:
+        cache_path = cache_dir / _get_sp_cache_key(
+            file_paths + [normalization_path],
+            vocab_size,
+            vocab_type,
+            vocab_seed,
+            vocab_split_by_unicode_script,
+            character_coverage,
+            max_train_size,
+            num_threads,
+            dedup_lines,
+        )
+        if (cache_path / "sp.model").is_file() and (cache_path / "sp.vocab").is_file():
+            LOGGER.info(f"Using the cached SentencePiece model in {cache_path}")
+            shutil.copy2(cache_path / "sp.model", model_prefix.with_suffix(".model"))
+            shutil.copy2(cache_path / "sp.vocab", model_prefix.with_suffix(".vocab"))
+            convert_vocab(model_prefix.with_suffix(".vocab"), vocab_path, tags)
+            return
+
     if vocab_seed is not None:
         sp.set_random_generator_seed(vocab_seed)
-    sp.SentencePieceTrainer.Train(
-        normalization_rule_tsv=normalization_path,
-        input=file_paths,
-        model_prefix=model_prefix,
-        model_type=vocab_type,
-        vocab_size=vocab_size,
-        user_defined_symbols="<blank>",
-        character_coverage="%.4f" % character_coverage,
-        input_sentence_size=max_train_size,
-        shuffle_input_sentence=True,
-        split_by_unicode_script=vocab_split_by_unicode_script,
-    )
+    with tempfile.TemporaryDirectory() as td:
+        if dedup_lines:
+            # repeated sentences (e.g. the same verse in several projects) are only counted once by the trainer
+            unique_path = Path(td) / "sp-unique.txt"
+            write_unique_lines(file_paths, unique_path)
+            file_paths = [unique_path]
+
+        # subsample large corpora up front, so that the trainer does not have to load every sentence
+        sample = sample_corpus_lines(file_paths, max_train_size, vocab_seed)
+        if sample is not None:
+            sample_path = Path(td) / "sp-train.txt"
+            with sample_path.open("w", encoding="utf-8", newline="\n", buffering=_WRITE_BUFFER_SIZE) as sample_file:
+                sample_file.writelines(sample)
+            del sample
+            file_paths = [sample_path]
+
+        with log_elapsed(LOGGER, f"sp_train_{model_prefix.name}"):
+            sp.SentencePieceTrainer.Train(
+                normalization_rule_tsv=normalization_path,
+                input=file_paths,
+                model_prefix=model_prefix,
+                model_type=vocab_type,
+                vocab_size=vocab_size,
+                user_defined_symbols="<blank>",
+                character_coverage="%.4f" % character_coverage,
+                input_sentence_size=max_train_size,
+                shuffle_input_sentence=True,
+                split_by_unicode_script=vocab_split_by_unicode_script,
+                num_threads=num_threads,
+                train_extremely_large_corpus=max_train_size > 10000000,
+            )
 
+    if cache_path is not None:
+        _cache_sp_model(model_prefix, cache_path)
     convert_vocab(model_prefix.with_suffix(".vocab"), vocab_path, tags)
 
 
+def _get_sp_cache_key(file_paths: List[Path], *settings: Any) -> str:
+    # the corpus files are identified by their path, size and modification time, instead of hashing their contents
+    key = hashlib.blake2b(digest_size=16)
+    key.update(repr((sp.__version__,) + settings).encode("utf-8"))
+    for file_path in file_paths:
+        stat = file_path.stat()
+        key.update(repr((str(file_path.resolve()), stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+    return key.hexdigest()
+
+
+def _cache_sp_model(model_prefix: Path, cache_path: Path) -> None:
+    # the model is copied to a temp directory that is renamed, so that a partially cached model is never used
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = Path(tempfile.mkdtemp(dir=cache_path.parent))
+    shutil.copy2(model_prefix.with_suffix(".model"), temp_path / "sp.model")
+    shutil.copy2(model_prefix.with_suffix(".vocab"), temp_path / "sp.vocab")
+    try:
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # the same model has already been cached by another process
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
 def get_checkpoint_path(
     model_dir: Path, checkpoint_type: Union[CheckpointType, str]
 ) -> Tuple[Optional[Path], Optional[int]]:
@@ -453,6 +545,46 @@ def get_data_file_pairs(corpus_pair: CorpusPair) -> Iterable[Tuple[DataFile, Dat
                 yield (src_file, trg_file)
 
 
+def _get_split_mask(corpus_size: int, indices: Optional[Set[int]]) -> np.ndarray:
+    if indices is None:
+        return np.ones(corpus_size, dtype=bool)
+    mask = np.zeros(corpus_size, dtype=bool)
+    mask[list(indices)] = True
+    return mask
+
+
+def _get_line_splits(
+    corpus_size: int,
+    test_indices: Optional[Set[int]],
+    val_indices: Optional[Set[int]],
+    train_indices: Optional[Set[int]],
+) -> List[int]:
+    # later assignments take precedence, so a line is only in one data set (test, then val, then train)
+    splits = np.full(corpus_size, _NO_SPLIT, dtype=np.int8)
+    splits[_get_split_mask(corpus_size, train_indices)] = _TRAIN_SPLIT
+    splits[_get_split_mask(corpus_size, val_indices)] = _VAL_SPLIT
+    splits[_get_split_mask(corpus_size, test_indices)] = _TEST_SPLIT
+    return splits.tolist()
+
+
+def _select_train_books(pair: CorpusPair, corpus: pd.DataFrame) -> pd.DataFrame:
+    if len(pair.corpus_books) > 0:
+        cur_train = include_books(corpus, pair.corpus_books)
+        if len(pair.corpus_books.intersection(pair.test_books)) > 0:
+            cur_train = exclude_books(cur_train, pair.test_books)
+        return cur_train
+    if len(pair.test_books) > 0:
+        return exclude_books(corpus, pair.test_books)
+    return corpus
+
+
+def _add_scores(
+    src_file: DataFile, trg_file: DataFile, corpus: pd.DataFrame, cur_train: pd.DataFrame, scores: Future
+) -> Tuple[DataFile, DataFile, pd.DataFrame, pd.DataFrame]:
+    cur_train["score"] = scores.result()
+    return src_file, trg_file, corpus, cur_train
+
+
 class Config:
     def __init__(self, exp_dir: Path, config: dict) -> None:
         config = merge_dict(
@@ -467,6 +599,9 @@ class Config:
                     "share_vocab": True,
                     "character_coverage": 1.0,
                     "sp_max_train_size": 1000000,
+                    # the trained vocab depends on the number of threads, so it is not tied to the number of cores
+                    "sp_num_threads": 16,
+                    "sp_dedup_lines": False,
                     "mirror": False,
                     "parent_use_best": False,
                     "parent_use_average": False,
@@ -597,6 +732,7 @@ class Config:
         self._has_scripture_data = False
         self._iso_pairs: Dict[Tuple[str, str], IsoPairInfo] = {}
         self.src_projects: Set[str] = set()
+        self._train_projects: Set[Tuple[str, str]] = set()
         for corpus_pair in self.corpus_pairs:
             pair_src_isos = {sf.iso for sf in corpus_pair.src_files}
             pair_trg_isos = {tf.iso for tf in corpus_pair.trg_files}
@@ -615,6 +751,10 @@ class Config:
                     if "en" in pair_trg_isos:
                         self.trg_file_paths.update(get_terms_glosses_file_paths(corpus_pair.trg_terms_files))
             self._tags.update(f"<{tag}>" for tag in corpus_pair.tags)
+            if corpus_pair.is_train:
+                self._train_projects.update(
+                    (df.iso, df.project) for df in corpus_pair.src_files + corpus_pair.trg_files
+                )
 
             for src_file in corpus_pair.src_files:
                 for trg_file in corpus_pair.trg_files:
@@ -711,11 +851,14 @@ class Config:
                 LOGGER.error("The source file " + str(file) + " does not exist.")
                 return
 
-        self._build_vocabs()
+        with log_elapsed(LOGGER, "vocabs"):
+            self._build_vocabs()
         src_spp, trg_spp = self.create_sp_processors()
-        train_count = self._build_corpora(src_spp, trg_spp, stats)
+        with log_elapsed(LOGGER, "corpora"):
+            train_count = self._build_corpora(src_spp, trg_spp, stats)
         if self.data["guided_alignment"]:
-            self._create_train_alignments(train_count)
+            with log_elapsed(LOGGER, "train_alignments"):
+                self._create_train_alignments(train_count)
         LOGGER.info("Preprocessing completed")
 
     def create_sp_processors(self) -> Tuple[Optional[sp.SentencePieceProcessor], Optional[sp.SentencePieceProcessor]]:
@@ -743,14 +886,7 @@ class Config:
         return src_spp
 
     def is_train_project(self, ref_file_path: Path) -> bool:
-        trg_iso, trg_project = self._parse_ref_file_path(ref_file_path)
-        for pair in self.corpus_pairs:
-            if not pair.is_train:
-                continue
-            for df in pair.src_files + pair.trg_files:
-                if df.iso == trg_iso and df.project == trg_project:
-                    return True
-        return False
+        return self._parse_ref_file_path(ref_file_path) in self._train_projects
 
     def is_ref_project(self, ref_projects: Set[str], ref_file_path: Path) -> bool:
         _, trg_project = self._parse_ref_file_path(ref_file_path)
@@ -765,10 +901,7 @@ class Config:
     def _build_corpora(
         self, src_spp: Optional[sp.SentencePieceProcessor], trg_spp: Optional[sp.SentencePieceProcessor], stats: bool
     ) -> int:
-        self._delete_files("train.*.txt")
-        self._delete_files("val.*.txt")
-        self._delete_files("test.*.txt")
-        self._delete_files("dict.*.txt")
+        self._delete_files(["train", "val", "test", "dict"])
 
         train_count = 0
         for pair in self.corpus_pairs:
@@ -778,9 +911,49 @@ class Config:
                 train_count += self._write_basic_data_sets(src_spp, trg_spp, pair)
         return train_count
 
-    def _delete_files(self, pattern: str) -> None:
-        for old_file_path in self.exp_dir.glob(pattern):
-            old_file_path.unlink()
+    def _delete_files(self, prefixes: List[str]) -> None:
+        # deletes the "<prefix>.*.txt" files with a single pass over the directory
+        name_prefixes = tuple(prefix + "." for prefix in prefixes)
+        with os.scandir(self.exp_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if (
+                    name.startswith(name_prefixes)
+                    and name.endswith(".txt")
+                    and len(name) >= name.index(".") + 5
+                    and entry.is_file()
+                ):
+                    os.unlink(entry.path)
+
+    def _load_scripture_corpora(
+        self, pair: CorpusPair, score: bool
+    ) -> Iterator[Tuple[DataFile, DataFile, pd.DataFrame, pd.DataFrame]]:
+        file_pairs = list(get_data_file_pairs(pair))
+        file_paths = [(src_file.path, trg_file.path) for src_file, trg_file in file_pairs]
+        corpora = (
+            (src_file, trg_file, corpus, _select_train_books(pair, corpus))
+            for (src_file, trg_file), corpus in zip(file_pairs, load_scripture_parallel_corpora(file_paths))
+        )
+        if not score:
+            yield from corpora
+            return
+
+        # the alignment scores of each file pair are computed independently, so they are computed in worker processes,
+        # but the file pairs are returned in order, so that the splits (which depend on the random seed) are unchanged
+        aligner_id = self.data["aligner"]
+        max_workers = max(min(len(file_pairs), multiprocessing.cpu_count() // 2), 1)
+        # the workers are spawned, since this process already runs the corpus loading pool and may have initialized
+        # TensorFlow, which makes forking it unsafe
+        with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending: Deque[Tuple[DataFile, DataFile, pd.DataFrame, pd.DataFrame, Future]] = deque()
+            for src_file, trg_file, corpus, cur_train in corpora:
+                if len(pending) == max_workers:
+                    yield _add_scores(*pending.popleft())
+                LOGGER.info(f"Computing alignment scores using {get_aligner_name(aligner_id)}")
+                scores = executor.submit(get_alignment_scores, cur_train[["source", "target"]], aligner_id)
+                pending.append((src_file, trg_file, corpus, cur_train, scores))
+            while len(pending) > 0:
+                yield _add_scores(*pending.popleft())
 
     def _write_scripture_data_sets(
         self,
@@ -802,9 +975,14 @@ class Config:
         test_indices: Optional[Set[int]] = None
         val_indices: Optional[Set[int]] = None
 
-        train: Optional[pd.DataFrame] = None
-        val: Dict[Tuple[str, str], pd.DataFrame] = {}
-        test: Dict[Tuple[str, str], pd.DataFrame] = {}
+        # the train set only needs to be kept in memory if it is combined across file pairs or augmented,
+        # otherwise each file pair is written out as soon as it has been processed
+        stream_train = pair.mapping != DataFileMapping.MIXED_SRC and len(pair.augmentations) == 0
+        has_train = False
+        train_count = 0
+        train_frames: List[pd.DataFrame] = []
+        val_frames: Dict[Tuple[str, str], List[pd.DataFrame]] = {}
+        test_frames: Dict[Tuple[str, str], List[pd.DataFrame]] = {}
         pair_val_indices: Dict[Tuple[str, str], Set[int]] = {}
         pair_test_indices: Dict[Tuple[str, str], Set[int]] = {}
         terms: Optional[pd.DataFrame] = None
@@ -819,24 +997,11 @@ class Config:
                 if stats_file.tell() == 0:
                     stats_file.write("src_project,trg_project,count,align_score,filtered_count,filtered_align_score\n")
 
-            for src_file, trg_file in get_data_file_pairs(pair):
-                corpus = get_scripture_parallel_corpus(src_file.path, trg_file.path)
-                if len(pair.corpus_books) > 0:
-                    cur_train = include_books(corpus, pair.corpus_books)
-                    if len(pair.corpus_books.intersection(pair.test_books)) > 0:
-                        cur_train = exclude_books(cur_train, pair.test_books)
-                elif len(pair.test_books) > 0:
-                    cur_train = exclude_books(corpus, pair.test_books)
-                else:
-                    cur_train = corpus
-
+            score = pair.is_train and (stats_file is not None or pair.score_threshold > 0)
+            for src_file, trg_file, corpus, cur_train in self._load_scripture_corpora(pair, score):
                 corpus_count = len(cur_train)
-                if pair.is_train and (stats_file is not None or pair.score_threshold > 0):
-                    aligner_id = self.data["aligner"]
-                    LOGGER.info(f"Computing alignment scores using {get_aligner_name(aligner_id)}")
-                    add_alignment_scores(cur_train, aligner_id)
-                    if stats_file is not None:
-                        cur_train.to_csv(self.exp_dir / f"{src_file.project}_{trg_file.project}.csv", index=False)
+                if score and stats_file is not None:
+                    cur_train.to_csv(self.exp_dir / f"{src_file.project}_{trg_file.project}.csv", index=False)
 
                 tags_str = self._get_tags_str(pair.tags, trg_file.iso)
                 mirror_tags_str = self._get_tags_str(pair.tags, src_file.iso)
@@ -870,7 +1035,7 @@ class Config:
                         trg_file.iso,
                         trg_file.project,
                         tags_str,
-                        test,
+                        test_frames,
                         pair_test_indices,
                         cur_test,
                     )
@@ -884,7 +1049,7 @@ class Config:
                         unfiltered_len = len(cur_train)
                         cur_train = filter_parallel_corpus(cur_train, pair.score_threshold)
                         filtered_count = unfiltered_len - len(cur_train)
-                        filtered_alignment_score = mean(cur_train["score"]) if stats_file is not None else 0
+                        filtered_alignment_score = cur_train["score"].mean() if stats_file is not None else 0
 
                     if stats_file is not None:
                         LOGGER.info(
@@ -915,29 +1080,39 @@ class Config:
                     )
 
                     self._add_to_eval_dataset(
-                        src_file.iso, trg_file.iso, trg_file.project, tags_str, val, pair_val_indices, cur_val
+                        src_file.iso, trg_file.iso, trg_file.project, tags_str, val_frames, pair_val_indices, cur_val
                     )
 
                 if pair.is_train:
+                    has_train = True
                     if self.mirror:
                         mirror_cur_train = cur_train.rename(columns={"source": "target", "target": "source"})
-                        train = self._add_to_train_dataset(
-                            trg_file.project,
+                        if stream_train:
+                            train_count += self._write_train_corpus(src_spp, trg_spp, mirror_cur_train, mirror_tags_str)
+                        else:
+                            self._add_to_train_dataset(
+                                trg_file.project,
+                                src_file.project,
+                                pair.mapping == DataFileMapping.MIXED_SRC,
+                                mirror_tags_str,
+                                train_frames,
+                                mirror_cur_train,
+                            )
+
+                    if stream_train:
+                        train_count += self._write_train_corpus(src_spp, trg_spp, cur_train, tags_str)
+                    else:
+                        self._add_to_train_dataset(
                             src_file.project,
+                            trg_file.project,
                             pair.mapping == DataFileMapping.MIXED_SRC,
-                            mirror_tags_str,
-                            train,
-                            mirror_cur_train,
+                            tags_str,
+                            train_frames,
+                            cur_train,
                         )
 
-                    train = self._add_to_train_dataset(
-                        src_file.project,
-                        trg_file.project,
-                        pair.mapping == DataFileMapping.MIXED_SRC,
-                        tags_str,
-                        train,
-                        cur_train,
-                    )
+        val = {iso_pair: combine_eval_frames(frames) for iso_pair, frames in val_frames.items()}
+        test = {iso_pair: combine_eval_frames(frames) for iso_pair, frames in test_frames.items()}
 
         terms_config = self.data["terms"]
         if terms_config["train"] or terms_config["dictionary"]:
@@ -977,28 +1152,27 @@ class Config:
                             mirror_tags_str = self._get_tags_str(pair.tags, "en")
                             terms = self._add_to_terms_dataset(tags_str, mirror_tags_str, terms, cur_terms)
 
-        if train is None:
+        if not has_train:
             return 0
 
-        if pair.mapping == DataFileMapping.MIXED_SRC:
-            train.fillna("", inplace=True)
-            src_columns: List[str] = [c for c in train.columns if c.startswith("source")]
-
-            def select_random_column(row: Any) -> pd.Series:
-                nonempty_src_columns: List[str] = [c for c in src_columns if row[c] != ""]
-                return row[random.choice(nonempty_src_columns)]
-
-            train["source"] = train[src_columns].apply(select_random_column, axis=1)
-            train.drop(src_columns, axis=1, inplace=True, errors="ignore")
+        if len(train_frames) > 0:
+            # the frames are combined once, instead of copying the combined data set for every file pair
+            if pair.mapping == DataFileMapping.MIXED_SRC:
+                train = combine_frames(train_frames)
+                src_columns: List[str] = [c for c in train.columns if c.startswith("source")]
+                # the rows are iterated as lists instead of with apply(), but each row still makes the same
+                # random.choice() over its nonempty sources, so the seeded selection is unchanged
+                src_rows: List[List[str]] = train[src_columns].to_numpy(dtype=object).tolist()
+                train["source"] = [random.choice([s for s in row if s != ""]) for row in src_rows]
+                train.drop(src_columns, axis=1, inplace=True, errors="ignore")
+            else:
+                train = pd.concat(train_frames, ignore_index=True)
 
-        self._append_corpus(self._train_src_filename(), encode_sp_lines(src_spp, train["source"]))
-        self._append_corpus(self._train_trg_filename(), encode_sp_lines(trg_spp, train["target"]))
-        self._append_corpus(self._train_vref_filename(), (str(vr) for vr in train["vref"]))
-        train_count = len(train)
-        augment_count = self._augment_corpus(
-            pair.augmentations, train["source"], train["target"], train["vref"], src_spp, trg_spp
-        )
-        train_count += augment_count
+            train_count += self._write_train_corpus(src_spp, trg_spp, train)
+            augment_count = self._augment_corpus(
+                pair.augmentations, train["source"], train["target"], train["vref"], src_spp, trg_spp
+            )
+            train_count += augment_count
 
         terms_train_count, dict_count = self._write_terms(src_spp, trg_spp, terms)
         train_count += terms_train_count
@@ -1026,7 +1200,7 @@ class Config:
                 project = column[len("target_") :]
                 self._append_corpus(
                     self._test_trg_filename(src_iso, trg_iso, project),
-                    decode_sp_lines(encode_sp_lines(trg_spp, pair_test[column])) if self.data["tokenize"] else pair_test[column],
+                    normalize_sp_lines(trg_spp, pair_test[column]) if self.data["tokenize"] else pair_test[column],
                 )
                 test_projects.remove(project)
             if self._has_multiple_test_projects(src_iso, trg_iso):
@@ -1069,7 +1243,7 @@ class Config:
         trg_iso: str,
         trg_project: str,
         tags_str: str,
-        dataset: Dict[Tuple[str, str], pd.DataFrame],
+        dataset: Dict[Tuple[str, str], List[pd.DataFrame]],
         pair_indices: Dict[Tuple[str, str], Set[int]],
         new_data: pd.DataFrame,
     ) -> None:
@@ -1078,19 +1252,11 @@ class Config:
 
         self._insert_tags(tags_str, new_data)
 
-        pair_data = dataset.get((src_iso, trg_iso))
-
         if (src_iso, trg_iso) not in pair_indices:
             pair_indices[(src_iso, trg_iso)] = set(new_data.index)
 
         new_data.rename(columns={"target": f"target_{trg_project}"}, inplace=True)
-        if pair_data is None:
-            pair_data = new_data
-        else:
-            pair_data = pair_data.combine_first(new_data)
-            pair_data.fillna("", inplace=True)
-
-        dataset[(src_iso, trg_iso)] = pair_data
+        dataset.setdefault((src_iso, trg_iso), []).append(new_data)
 
     def _add_to_train_dataset(
         self,
@@ -1098,9 +1264,9 @@ class Config:
         trg_project: str,
         mixed_src: bool,
         tags_str: str,
-        train: Optional[pd.DataFrame],
+        train_frames: List[pd.DataFrame],
         cur_train: pd.DataFrame,
-    ) -> pd.DataFrame:
+    ) -> None:
         self._insert_tags(tags_str, cur_train)
         if mixed_src:
             cur_train.rename(columns={"source": f"source_{src_project}"}, inplace=True)
@@ -1110,14 +1276,35 @@ class Config:
                 ),
                 inplace=True,
             )
-            train = cur_train if train is None else train.combine_first(cur_train)
-        else:
-            train = pd.concat([train, cur_train], ignore_index=True)
-        return train
+        train_frames.append(cur_train)
+
+    def _write_train_corpus(
+        self,
+        src_spp: Optional[sp.SentencePieceProcessor],
+        trg_spp: Optional[sp.SentencePieceProcessor],
+        train: pd.DataFrame,
+        tags_str: str = "",
+    ) -> int:
+        # the tags are not tokenized, so they are prepended to the already encoded sentences
+        src_lines = encode_sp_lines(src_spp, train["source"])
+        if tags_str != "":
+            src_lines = (tags_str + line for line in src_lines)
+        # each file is written on its own thread, so that writing one file overlaps with encoding the others
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(self._append_corpus, self._train_src_filename(), src_lines),
+                executor.submit(
+                    self._append_corpus, self._train_trg_filename(), encode_sp_lines(trg_spp, train["target"])
+                ),
+                executor.submit(self._append_corpus, self._train_vref_filename(), (str(vr) for vr in train["vref"])),
+            ]
+            for future in futures:
+                future.result()
+        return len(train)
 
     def _insert_tags(self, tags_str: str, sentences: pd.DataFrame) -> None:
         if tags_str != "":
-            cast(Any, sentences).loc[:, "source"] = tags_str + sentences.loc[:, "source"]
+            sentences["source"] = [tags_str + source for source in sentences["source"].tolist()]
 
     def _add_to_terms_dataset(
         self, tags_str: str, mirror_tags_str: str, terms: Optional[pd.DataFrame], cur_terms: pd.DataFrame
@@ -1158,20 +1345,20 @@ class Config:
                 dict_vref_file = stack.enter_context(self._open_append(self._dict_vref_filename()))
 
             if terms is not None:
-                for _, term in terms.iterrows():
-                    src_term = cast(str, term["source"])
-                    trg_term = cast(str, term["target"])
-                    dictionary = cast(bool, term["dictionary"])
-                    vrefs = cast(str, term["vrefs"])
-                    src_term_variants = [
-                        encode_sp(src_spp, src_term, add_dummy_prefix=True),
-                        encode_sp(src_spp, src_term, add_dummy_prefix=False),
-                    ]
-                    trg_term_variants = [
-                        encode_sp(trg_spp, trg_term, add_dummy_prefix=True),
-                        encode_sp(trg_spp, trg_term, add_dummy_prefix=False),
-                    ]
-
+                # each variant of the terms is encoded in batches
+                src_terms: List[str] = terms["source"].tolist()
+                trg_terms: List[str] = terms["target"].tolist()
+                src_terms_variants = zip(
+                    encode_sp_lines(src_spp, src_terms, add_dummy_prefix=True),
+                    encode_sp_lines(src_spp, src_terms, add_dummy_prefix=False),
+                )
+                trg_terms_variants = zip(
+                    encode_sp_lines(trg_spp, trg_terms, add_dummy_prefix=True),
+                    encode_sp_lines(trg_spp, trg_terms, add_dummy_prefix=False),
+                )
+                for src_term_variants, trg_term_variants, dictionary, vrefs in zip(
+                    src_terms_variants, trg_terms_variants, terms["dictionary"].tolist(), terms["vrefs"].tolist()
+                ):
                     if train_src_file is not None and train_trg_file is not None and train_vref_file is not None:
                         for stv, ttv in zip(src_term_variants, trg_term_variants):
                             train_src_file.write(stv + "\n")
@@ -1194,30 +1381,19 @@ class Config:
     def _write_val_corpora(
         self, trg_spp: Optional[sp.SentencePieceProcessor], val: Dict[Tuple[str, str], pd.DataFrame]
     ) -> None:
-        with ExitStack() as stack:
-            ref_files: List[TextIO] = []
-            for (src_iso, trg_iso), pair_val in val.items():
-                columns: List[str] = [c for c in pair_val.columns if c.startswith("target")]
-                if self.root["eval"]["multi_ref_eval"]:
-                    val_project_count = self._get_val_ref_count(src_iso, trg_iso)
-                    for index in pair_val.index:
-                        for ci in range(val_project_count):
-                            if len(ref_files) == ci:
-                                ref_files.append(stack.enter_context(self._open_append(self._val_trg_filename(ci))))
-                            if ci < len(columns):
-                                col = columns[ci]
-                                ref_files[ci].write(
-                                    encode_sp(trg_spp, cast(str, pair_val.loc[index, col]).strip()) + "\n"
-                                )
-                            else:
-                                ref_files[ci].write("\n")
-                else:
-                    for index in pair_val.index:
-                        if len(ref_files) == 0:
-                            ref_files.append(stack.enter_context(self._open_append(self._val_trg_filename())))
-                        columns_with_data = [c for c in columns if cast(str, pair_val.loc[index, c]).strip() != ""]
-                        col = random.choice(columns_with_data)
-                        ref_files[0].write(encode_sp(trg_spp, cast(str, pair_val.loc[index, col]).strip()) + "\n")
+        for (src_iso, trg_iso), pair_val in val.items():
+            columns: List[str] = [c for c in pair_val.columns if c.startswith("target")]
+            column_values = [[cast(str, value).strip() for value in pair_val[c].tolist()] for c in columns]
+            if self.root["eval"]["multi_ref_eval"]:
+                val_project_count = self._get_val_ref_count(src_iso, trg_iso)
+                for ci in range(val_project_count):
+                    if ci < len(columns):
+                        self._append_corpus(self._val_trg_filename(ci), encode_sp_lines(trg_spp, column_values[ci]))
+                    else:
+                        self._fill_corpus(self._val_trg_filename(ci), len(pair_val))
+            else:
+                sentences = [random.choice([v for v in row if v != ""]) for row in zip(*column_values)]
+                self._append_corpus(self._val_trg_filename(), encode_sp_lines(trg_spp, sentences))
 
     def _append_corpus(self, filename: str, sentences: Iterable[str]) -> None:
         write_corpus(self.exp_dir / filename, sentences, append=True)
@@ -1226,7 +1402,7 @@ class Config:
         write_corpus(self.exp_dir / filename, ("" for _ in range(size)), append=True)
 
     def _open_append(self, filename: str) -> TextIO:
-        return (self.exp_dir / filename).open("a", encoding="utf-8", newline="\n")
+        return (self.exp_dir / filename).open("a", encoding="utf-8", newline="\n", buffering=_WRITE_BUFFER_SIZE)
 
     def _write_basic_data_sets(
         self,
@@ -1267,6 +1443,14 @@ class Config:
                 train_size = pair.size
                 train_indices = split_corpus(corpus_size, train_size, test_indices | val_indices)
 
+            # the data set of every line is resolved up front, so the line loop only does a single list lookup
+            splits = _get_line_splits(
+                corpus_size,
+                test_indices if pair.is_test else set(),
+                val_indices if pair.is_val else set(),
+                train_indices if pair.is_train else set(),
+            )
+
             train_count = 0
             val_count = 0
             test_count = 0
@@ -1288,6 +1472,7 @@ class Config:
             val_trg_ref_files: List[TextIO] = []
             dict_src_file: Optional[TextIO] = None
             dict_trg_file: Optional[TextIO] = None
+            dict_vref_file: Optional[TextIO] = None
             if self._has_scripture_data:
                 train_vref_file = stack.enter_context(self._open_append(self._train_vref_filename()))
                 val_vref_file = stack.enter_context(self._open_append(self._val_vref_filename()))
@@ -1313,8 +1498,68 @@ class Config:
                 dict_trg_file = stack.enter_context(self._open_append(self._dict_trg_filename()))
                 dict_vref_file = stack.enter_context(self._open_append(self._dict_vref_filename()))
 
+            test_src_sentences: List[str] = []
+            test_trg_sentences: List[str] = []
+            val_src_sentences: List[str] = []
+            val_trg_sentences: List[str] = []
+            dict_sentences: List[Tuple[str, str]] = []
+            # (source, target, mirrored) train sentence pairs that are encoded in batches
+            train_sentences: List[Tuple[str, str, bool]] = []
+
+            def write_train_sentences() -> None:
+                self._write_train_sentence_pairs(
+                    train_src_file,
+                    train_trg_file,
+                    train_vref_file,
+                    src_spp,
+                    trg_spp,
+                    train_sentences,
+                    pair.is_lexical_data,
+                )
+                train_sentences.clear()
+
+            def write_eval_sentences() -> None:
+                # test, val and dictionary sentences are not noised, so they are encoded in batches
+                # the empty vref and reference lines for the batch are written all at once
+                if test_vref_file is not None:
+                    test_vref_file.write("\n" * len(test_src_sentences))
+                for test_trg_project_file in test_trg_project_files:
+                    test_trg_project_file.write("\n" * len(test_src_sentences))
+                if val_vref_file is not None:
+                    val_vref_file.write("\n" * len(val_src_sentences))
+                for val_trg_ref_file in val_trg_ref_files:
+                    val_trg_ref_file.write("\n" * len(val_src_sentences))
+                if dict_vref_file is not None:
+                    dict_vref_file.write("\n" * len(dict_sentences))
+                test_src_file.writelines(line + "\n" for line in encode_sp_lines(src_spp, test_src_sentences))
+                test_trg_file.writelines(line + "\n" for line in normalize_sp_lines(trg_spp, test_trg_sentences))
+                val_src_file.writelines(line + "\n" for line in encode_sp_lines(src_spp, val_src_sentences))
+                val_trg_file.writelines(line + "\n" for line in encode_sp_lines(trg_spp, val_trg_sentences))
+                if dict_src_file is not None and dict_trg_file is not None and len(dict_sentences) > 0:
+                    dict_src_sentences = [src_sentence for src_sentence, _ in dict_sentences]
+                    dict_trg_sentences = [trg_sentence for _, trg_sentence in dict_sentences]
+                    dict_src_file.writelines(
+                        f"{with_prefix}\t{without_prefix}\n"
+                        for with_prefix, without_prefix in zip(
+                            encode_sp_lines(src_spp, dict_src_sentences, add_dummy_prefix=True),
+                            encode_sp_lines(src_spp, dict_src_sentences, add_dummy_prefix=False),
+                        )
+                    )
+                    dict_trg_file.writelines(
+                        f"{with_prefix}\t{without_prefix}\n"
+                        for with_prefix, without_prefix in zip(
+                            encode_sp_lines(trg_spp, dict_trg_sentences, add_dummy_prefix=True),
+                            encode_sp_lines(trg_spp, dict_trg_sentences, add_dummy_prefix=False),
+                        )
+                    )
+                test_src_sentences.clear()
+                test_trg_sentences.clear()
+                val_src_sentences.clear()
+                val_trg_sentences.clear()
+                dict_sentences.clear()
+
             index = 0
-            for src_line, trg_line in tqdm(zip(input_src_file, input_trg_file)):
+            for src_line, trg_line in tqdm(prefetch(zip(input_src_file, input_trg_file))):
                 src_line = src_line.strip()
                 trg_line = trg_line.strip()
                 if len(src_line) == 0 or len(trg_line) == 0:
@@ -1323,23 +1568,22 @@ class Config:
                 src_sentence = tags_str + src_line
                 trg_sentence = trg_line
 
-                if pair.is_test and (test_indices is None or index in test_indices):
-                    test_src_file.write(encode_sp(src_spp, src_sentence) + "\n")
-                    test_trg_file.write(decode_sp(encode_sp(trg_spp, trg_sentence)) + "\n")
-                    if test_vref_file is not None:
-                        test_vref_file.write("\n")
-                    for test_trg_project_file in test_trg_project_files:
-                        test_trg_project_file.write("\n")
+                split = splits[index]
+                if split == _TEST_SPLIT:
+                    test_src_sentences.append(src_sentence)
+                    test_trg_sentences.append(trg_sentence)
                     test_count += 1
-                elif pair.is_val and (val_indices is None or index in val_indices):
-                    val_src_file.write(encode_sp(src_spp, src_sentence) + "\n")
-                    val_trg_file.write(encode_sp(trg_spp, trg_sentence) + "\n")
-                    if val_vref_file is not None:
-                        val_vref_file.write("\n")
-                    for val_trg_ref_file in val_trg_ref_files:
-                        val_trg_ref_file.write("\n")
+                elif split == _VAL_SPLIT:
+                    val_src_sentences.append(src_sentence)
+                    val_trg_sentences.append(trg_sentence)
                     val_count += 1
-                elif pair.is_train and (train_indices is None or index in train_indices):
+                elif split == _TRAIN_SPLIT and len(pair.augmentations) == 0:
+                    # the noise is still applied a line at a time, so that the random state is used in the same order
+                    train_sentences.append((self._noise(pair.src_noise, src_sentence), trg_sentence, False))
+                    if self.mirror:
+                        train_sentences.append((mirror_tags_str + trg_line, src_line, True))
+                    train_count += (2 if self.mirror else 1) * (2 if pair.is_lexical_data else 1)
+                elif split == _TRAIN_SPLIT:
                     noised_src_sentence = self._noise(pair.src_noise, src_sentence)
                     train_count += self._write_train_sentence_pair(
                         train_src_file,
@@ -1375,20 +1619,18 @@ class Config:
                     and dict_trg_file is not None
                     and dict_vref_file is not None
                 ):
-                    src_variants = [
-                        encode_sp(src_spp, src_sentence, add_dummy_prefix=True),
-                        encode_sp(src_spp, src_sentence, add_dummy_prefix=False),
-                    ]
-                    trg_variants = [
-                        encode_sp(trg_spp, trg_sentence, add_dummy_prefix=True),
-                        encode_sp(trg_spp, trg_sentence, add_dummy_prefix=False),
-                    ]
-                    dict_src_file.write("\t".join(src_variants) + "\n")
-                    dict_trg_file.write("\t".join(trg_variants) + "\n")
-                    dict_vref_file.write("\n")
+                    dict_sentences.append((src_sentence, trg_sentence))
                     dict_count += 1
 
+                if (
+                    len(test_src_sentences) + len(val_src_sentences) + len(dict_sentences) + len(train_sentences)
+                    >= _EVAL_SENTENCE_BATCH_SIZE
+                ):
+                    write_eval_sentences()
+                    write_train_sentences()
                 index += 1
+            write_eval_sentences()
+            write_train_sentences()
 
         LOGGER.info(
             f"train size: {train_count}, val size: {val_count}, test size: {test_count}, dict size: {dict_count}"
@@ -1427,6 +1669,41 @@ class Config:
                 vref_file.write("\n")
         return len(src_variants)
 
+    def _write_train_sentence_pairs(
+        self,
+        src_file: TextIO,
+        trg_file: TextIO,
+        vref_file: Optional[TextIO],
+        src_spp: Optional[sp.SentencePieceProcessor],
+        trg_spp: Optional[sp.SentencePieceProcessor],
+        sentence_pairs: List[Tuple[str, str, bool]],
+        is_lexical: bool,
+    ) -> None:
+        # batched equivalent of _write_train_sentence_pair() without augmentations, mirrored pairs are encoded with
+        # the swapped models
+        dummy_prefixes = [True, False] if is_lexical else [True]
+        src_variants: List[List[str]] = [[] for _ in sentence_pairs]
+        trg_variants: List[List[str]] = [[] for _ in sentence_pairs]
+        for mirrored, pair_src_spp, pair_trg_spp in [(False, src_spp, trg_spp), (True, trg_spp, src_spp)]:
+            indices = [i for i, (_, _, m) in enumerate(sentence_pairs) if m == mirrored]
+            if len(indices) == 0:
+                continue
+            src_sentences = [sentence_pairs[i][0] for i in indices]
+            trg_sentences = [sentence_pairs[i][1] for i in indices]
+            for add_dummy_prefix in dummy_prefixes:
+                for i, src_variant, trg_variant in zip(
+                    indices,
+                    encode_sp_lines(pair_src_spp, src_sentences, add_dummy_prefix=add_dummy_prefix),
+                    encode_sp_lines(pair_trg_spp, trg_sentences, add_dummy_prefix=add_dummy_prefix),
+                ):
+                    src_variants[i].append(src_variant)
+                    trg_variants[i].append(trg_variant)
+
+        src_file.writelines(variant + "\n" for variants in src_variants for variant in variants)
+        trg_file.writelines(variant + "\n" for variants in trg_variants for variant in variants)
+        if vref_file is not None:
+            vref_file.write("\n" * sum(len(variants) for variants in src_variants))
+
     def _get_tags_str(self, tags: List[str], trg_iso: str) -> str:
         tags_str = ""
         if len(tags) > 0:
@@ -1549,55 +1826,23 @@ class Config:
 
         if self.share_vocab:
             LOGGER.info("Building shared vocabulary...")
-            vocab_size: Optional[int] = self.data.get("vocab_size")
-            if vocab_size is None:
-                vocab_size = self.data.get("src_vocab_size")
-                if vocab_size is None:
-                    vocab_size = self.data["trg_vocab_size"]
-                elif self.data.get("trg_vocab_size", vocab_size) != vocab_size:
-                    raise RuntimeError(
-                        "The source and target vocab sizes cannot be different when creating a shared vocab."
-                    )
+            vocab_size: int = self._get_shared_vocab_setting(
+                "vocab_size", "The source and target vocab sizes cannot be different when creating a shared vocab."
+            )
+            vocab_type: str = self._get_shared_vocab_setting(
+                "vocab_type", "The source and target vocab types cannot be different when creating a shared vocab."
+            )
+            vocab_seed: Optional[int] = self._get_shared_vocab_setting("vocab_seed")
+            casing: str = self._get_shared_vocab_setting(
+                "casing", "The source and target casing cannot be different when creating a shared vocab."
+            )
+            vocab_split_by_unicode_script: bool = self._get_shared_vocab_setting(
+                "vocab_split_by_unicode_script",
+                "The source and target cannot split tokens differently when creating a shared vocab.",
+            )
             assert vocab_size is not None
-
-            vocab_type: Optional[str] = self.data.get("vocab_type")
-            if vocab_type is None:
-                vocab_type = self.data.get("src_vocab_type")
-                if vocab_type is None:
-                    vocab_type = self.data["trg_vocab_type"]
-                elif self.data.get("trg_vocab_type", vocab_type) != vocab_type:
-                    raise RuntimeError(
-                        "The source and target vocab types cannot be different when creating a shared vocab."
-                    )
             assert vocab_type is not None
-
-            vocab_seed: Optional[int] = self.data.get("vocab_seed")
-            if vocab_seed is None:
-                vocab_seed = self.data.get("src_vocab_seed")
-                if vocab_seed is None:
-                    vocab_seed = self.data["trg_vocab_seed"]
-
-            casing: Optional[str] = self.data.get("casing")
-            if casing is None:
-                casing = self.data.get("src_casing")
-                if casing is None:
-                    casing = self.data["trg_casing"]
-                elif self.data.get("trg_casing", casing) != casing:
-                    raise RuntimeError("The source and target casing cannot be different when creating a shared vocab.")
             assert casing is not None
-
-            vocab_split_by_unicode_script: Optional[bool] = self.data.get("vocab_split_by_unicode_script")
-            if vocab_split_by_unicode_script is None:
-                vocab_split_by_unicode_script = self.data.get("src_vocab_split_by_unicode_script")
-                if vocab_split_by_unicode_script is None:
-                    vocab_split_by_unicode_script = self.data["trg_vocab_split_by_unicode_script"]
-                elif (
-                    self.data.get("trg_vocab_split_by_unicode_script", vocab_split_by_unicode_script)
-                    != vocab_split_by_unicode_script
-                ):
-                    raise RuntimeError(
-                        "The source and target cannot split tokens differently when creating a shared vocab."
-                    )
             assert vocab_split_by_unicode_script is not None
 
             model_prefix = self.exp_dir / "sp"
@@ -1617,21 +1862,55 @@ class Config:
                 vocab_path,
                 self._tags,
                 max_train_size,
+                self.data["sp_num_threads"],
+                SIL_NLP_ENV.sp_cache_dir,
+                self.data["sp_dedup_lines"],
             )
 
-            self._update_vocab(vocab_path, vocab_path)
+            with log_elapsed(LOGGER, "update_vocab"):
+                self._update_vocab(vocab_path, vocab_path)
         else:
             src_vocab_file_paths: Set[Path] = set(self.src_file_paths)
             if self.mirror:
                 src_vocab_file_paths.update(self.trg_file_paths)
-            self._create_unshared_vocab(self.src_isos, src_vocab_file_paths, "source")
+            src_vocab_args = self._prepare_unshared_vocab(self.src_isos, src_vocab_file_paths, "source")
 
             trg_vocab_file_paths: Set[Path] = set(self.trg_file_paths)
             if self.mirror:
                 trg_vocab_file_paths.update(self.src_file_paths)
-            self._create_unshared_vocab(self.trg_isos, trg_vocab_file_paths, "target")
-
-            self._update_vocab(self.exp_dir / "src-onmt.vocab", self.exp_dir / "trg-onmt.vocab")
+            trg_vocab_args = self._prepare_unshared_vocab(self.trg_isos, trg_vocab_file_paths, "target")
+
+            vocab_args = [args for args in (src_vocab_args, trg_vocab_args) if args is not None]
+            num_threads: int = self.data["sp_num_threads"]
+            dedup_lines: bool = self.data["sp_dedup_lines"]
+            if len(vocab_args) > 1:
+                # the SentencePiece trainer holds the GIL, so the source and target models are trained at the same
+                # time in separate processes. Each one still uses all of the threads, since the trained vocab depends
+                # on the number of threads.
+                with ProcessPoolExecutor(len(vocab_args)) as executor:
+                    futures = [
+                        executor.submit(build_vocab, *args, num_threads, SIL_NLP_ENV.sp_cache_dir, dedup_lines)
+                        for args in vocab_args
+                    ]
+                    for future in futures:
+                        future.result()
+            else:
+                for args in vocab_args:
+                    build_vocab(*args, num_threads, SIL_NLP_ENV.sp_cache_dir, dedup_lines)
+
+            with log_elapsed(LOGGER, "update_vocab"):
+                self._update_vocab(self.exp_dir / "src-onmt.vocab", self.exp_dir / "trg-onmt.vocab")
+
+    def _get_shared_vocab_setting(self, name: str, mismatch_error: Optional[str] = None) -> Any:
+        # the shared setting falls back to the source setting and then the target setting, which must agree
+        value = self.data.get(name)
+        if value is None:
+            value = self.data.get(f"src_{name}")
+            if value is None:
+                value = self.data[f"trg_{name}"]
+            elif mismatch_error is not None and self.data.get(f"trg_{name}", value) != value:
+                raise RuntimeError(mismatch_error)
+        return value
 
     def _update_vocab(self, src_vocab_path: Path, trg_vocab_path: Path) -> None:
         if self.parent_config is None:
@@ -1645,6 +1924,15 @@ class Config:
             else CheckpointType.LAST
         )
         checkpoint_path, step = get_checkpoint_path(self.parent_config.model_dir, parent_model_to_use)
+        if checkpoint_path is not None and self._has_parent_vocabs(src_vocab_path, trg_vocab_path):
+            # the weights would be transferred unchanged, so the parent checkpoint is used as is
+            parent_dir = self.exp_dir / "parent"
+            parent_dir.mkdir(exist_ok=True)
+            for file_path in checkpoint_path.parent.glob(f"{checkpoint_path.name}.*"):
+                shutil.copy2(file_path, parent_dir / file_path.name)
+            tf.compat.v1.train.update_checkpoint_state(str(parent_dir), checkpoint_path.name)
+            return
+
         parent_runner = create_runner(self.parent_config)
         parent_runner.update_vocab(
             str(self.exp_dir / "parent"),
@@ -1655,7 +1943,26 @@ class Config:
             transfer_alignment_heads=self.data["transfer_alignment_heads"],
         )
 
-    def _create_unshared_vocab(self, isos: Set[str], vocab_file_paths: Set[Path], side: str) -> None:
+    def _has_parent_vocabs(self, src_vocab_path: Path, trg_vocab_path: Path) -> bool:
+        assert self.parent_config is not None
+        if self.model != self.parent_config.model or not self.data["transfer_alignment_heads"]:
+            return False
+        if self.parent_config.share_vocab:
+            parent_src_vocab_path = parent_trg_vocab_path = self.parent_config.exp_dir / "onmt.vocab"
+        else:
+            parent_src_vocab_path = self.parent_config.exp_dir / "src-onmt.vocab"
+            parent_trg_vocab_path = self.parent_config.exp_dir / "trg-onmt.vocab"
+        return (
+            parent_src_vocab_path.is_file()
+            and parent_trg_vocab_path.is_file()
+            and filecmp.cmp(src_vocab_path, parent_src_vocab_path, shallow=False)
+            and filecmp.cmp(trg_vocab_path, parent_trg_vocab_path, shallow=False)
+        )
+
+    def _prepare_unshared_vocab(
+        self, isos: Set[str], vocab_file_paths: Set[Path], side: str
+    ) -> Optional[Tuple[Any, ...]]:
+        # returns the build_vocab() arguments (except the thread count), if the vocab still needs to be trained
         prefix = "src" if side == "source" else "trg"
         model_prefix = self.exp_dir / f"{prefix}-sp"
         vocab_path = self.exp_dir / f"{prefix}-onmt.vocab"
@@ -1682,8 +1989,11 @@ class Config:
 
                     child_tokens = set()
                     for vocab_file_path in vocab_file_paths:
-                        for line in encode_sp_lines(parent_spp, load_corpus(vocab_file_path)):
-                            child_tokens.update(line.split())
+                        # repeated lines are only encoded once
+                        lines = dict.fromkeys(load_corpus(vocab_file_path))
+                        child_tokens.update(
+                            itertools.chain.from_iterable(line.split() for line in encode_sp_lines(parent_spp, lines))
+                        )
                     parent_use_vocab = child_tokens.issubset(parent_vocab.words)
 
                 # all tokens in the child corpora are in the parent vocab, so we can just use the parent vocab
@@ -1694,12 +2004,11 @@ class Config:
                     shutil.copy2(parent_sp_prefix_path.with_suffix(".model"), self.exp_dir / f"{prefix}-sp.model")
                     shutil.copy2(parent_sp_prefix_path.with_suffix(".vocab"), sp_vocab_path)
                     convert_vocab(sp_vocab_path, onmt_vocab_path, tags)
-                    return
+                    return None
                 elif child_tokens is not None and parent_vocab is not None:
                     onmt_delta_vocab_path = self.exp_dir / f"{prefix}-onmt-delta.vocab"
                     vocab_delta = child_tokens.difference(parent_vocab.words)
-                    with onmt_delta_vocab_path.open("w", encoding="utf-8", newline="\n") as f:
-                        [f.write(f"{token}\n") for token in vocab_delta]
+                    onmt_delta_vocab_path.write_bytes("".join(token + "\n" for token in vocab_delta).encode("utf-8"))
 
         LOGGER.info(f"Building {side} vocabulary...")
         vocab_size: int = self.data.get(f"{prefix}_vocab_size", self.data.get("vocab_size"))
@@ -1711,7 +2020,7 @@ class Config:
         )
         character_coverage: float = self.data.get(f"{prefix}_character_coverage", self.data.get("character_coverage"))
         max_train_size: int = self.data["sp_max_train_size"]
-        build_vocab(
+        return (
             vocab_file_paths,
             vocab_size,
             vocab_type,
@@ -1838,7 +2147,8 @@ def load_config(exp_name: str) -> Config:
     config_path = exp_dir / "config.yml"
 
     with config_path.open("r", encoding="utf-8") as file:
-        config = yaml.safe_load(file)
+        # the libyaml loader is used when PyYAML was built with it
+        config = yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
     return Config(exp_dir, config)
 
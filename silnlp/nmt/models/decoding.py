@@ -18,7 +18,7 @@ class DictionaryGuidedBeamSearch(BeamSearch):
     def __init__(
         self,
         src_entry_indices: tf.Tensor,
-        trg_entries: tf.Tensor,
+        trg_entries: tf.RaggedTensor,
         beam_size: int,
         length_penalty: float = 0,
         coverage_penalty: float = 0,
@@ -32,7 +32,7 @@ class DictionaryGuidedBeamSearch(BeamSearch):
         )
         self.src_entry_indices = src_entry_indices
         self.trg_entries = trg_entries
-        self.trg_variant_length = tf.shape(self.trg_entries)[-1]
+        self.trg_variant_length = _get_max_variant_length(trg_entries)
 
     def initialize(self, start_ids, attention_size=None):
         batch_size = tf.shape(start_ids)[0]
@@ -127,7 +127,21 @@ class DictionaryGuidedBeamSearch(BeamSearch):
         attn = tf.reshape(attention, [-1, self.beam_size, tf.shape(attention)[1]])
         aligned_src_indices = tf.math.argmax(attn, axis=2)
         step_trg_entry_indices = tf.gather(self.src_entry_indices, aligned_src_indices, axis=1, batch_dims=1)
-        step_trg_entries: tf.Tensor = tf.gather(self.trg_entries, step_trg_entry_indices, axis=1, batch_dims=1)
+        # Only the entries aligned with the current step are converted to a dense tensor. The variant dimension is padded
+        # to at least one variant, and the token dimension is padded to the longest variant in the whole batch.
+        step_trg_entries: tf.Tensor = tf.gather(
+            self.trg_entries, step_trg_entry_indices, axis=1, batch_dims=1
+        ).to_tensor()
+        entries_shape = tf.shape(step_trg_entries)
+        step_trg_entries = tf.pad(
+            step_trg_entries,
+            [
+                [0, 0],
+                [0, 0],
+                [0, tf.maximum(1 - entries_shape[2], 0)],
+                [0, self.trg_variant_length - entries_shape[3]],
+            ],
+        )
 
         batch_size = tf.shape(step_trg_entries)[0]
         step_trg_entries = tf.reshape(step_trg_entries, (batch_size * self.beam_size, -1, self.trg_variant_length))
@@ -184,6 +198,10 @@ class DictionaryGuidedBeamSearch(BeamSearch):
         return active_trg_entries, used_trg_entry_indices
 
 
+def _get_max_variant_length(trg_entries: tf.RaggedTensor) -> tf.Tensor:
+    return tf.maximum(tf.reduce_max(trg_entries.nested_row_lengths()[-1]), 0)
+
+
 def dynamic_decode(
     symbols_to_logits_fn,
     start_ids,
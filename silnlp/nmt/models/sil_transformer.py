@@ -147,18 +147,23 @@ class SILTransformer(Transformer):
         ref_dict_path: Optional[str] = data_config.get("ref_dictionary")
         if src_dict_path is not None and trg_dict_path is not None and ref_dict_path is not None:
             self.labels_inputter.set_decoder_mode(enable=False, mark_start=False, mark_end=False)
-            dictionary_compiler = TrieCompiler(self.features_inputter.vocabulary_size)
+            src_entries: List[List[str]] = []
+            trg_entries: List[List[str]] = []
+            ref_entries: List[List[str]] = []
             with tf.io.gfile.GFile(src_dict_path) as src_dict, tf.io.gfile.GFile(
                 trg_dict_path
             ) as trg_dict, tf.io.gfile.GFile(ref_dict_path) as ref_dict:
                 for src_entry_str, trg_entry_str, ref_entry_str in zip(src_dict, trg_dict, ref_dict):
-                    src_entry = src_entry_str.strip().split("\t")
-                    src_ids = [self.features_inputter.make_features(tf.constant(se.strip()))["ids"] for se in src_entry]
-                    trg_entry = trg_entry_str.strip().split("\t")
-                    trg_ids = [self.labels_inputter.make_features(tf.constant(te.strip()))["ids"] for te in trg_entry]
-                    refs = ref_entry_str.strip().split("\t")
-                    for src_variant_ids in src_ids:
-                        dictionary_compiler.add(src_variant_ids, trg_ids, refs)
+                    src_entries.append([se.strip() for se in src_entry_str.strip().split("\t")])
+                    trg_entries.append([te.strip() for te in trg_entry_str.strip().split("\t")])
+                    ref_entries.append(ref_entry_str.strip().split("\t"))
+            dictionary_compiler = TrieCompiler(self.features_inputter.vocabulary_size)
+            if len(src_entries) > 0:
+                src_ids = lookup_entry_ids(self.features_inputter, src_entries)
+                trg_ids = lookup_entry_ids(self.labels_inputter, trg_entries)
+                for src_entry_ids, trg_entry_ids, refs in zip(src_ids, trg_ids, ref_entries):
+                    for src_variant_ids in src_entry_ids:
+                        dictionary_compiler.add(src_variant_ids, trg_entry_ids, refs)
             if not dictionary_compiler.empty:
                 self._dictionary = dictionary_compiler.compile()
             self.labels_inputter.set_decoder_mode(mark_start=True, mark_end=True)
@@ -175,15 +180,23 @@ class SILTransformer(Transformer):
             source_inputs, sequence_length=source_length
         )
 
-        predictions = self._dynamic_decode(features, encoder_outputs, encoder_state, encoder_sequence_length)
+        predictions = self._dynamic_decode(
+            features, encoder_outputs, encoder_state, encoder_sequence_length, return_ids=True
+        )
 
         length = predictions["length"]
         length = tf.squeeze(length, axis=[1])
-        tokens = predictions["tokens"]
-        tokens = tf.squeeze(tokens, axis=[1])
-        tokens = tf.where(tf.equal(tokens, "</s>"), tf.fill(tf.shape(tokens), ""), tokens)
-
-        ids = self.labels_inputter.tokens_to_ids.lookup(tokens)
+        if "ids" in predictions:
+            ids = predictions["ids"]
+            ids = tf.squeeze(ids, axis=[1])
+            ids = tf.where(tf.not_equal(ids, END_OF_SENTENCE_ID), ids, tf.zeros_like(ids))
+            ids = tf.cast(ids, tf.int64)
+        else:
+            # the predicted tokens were rewritten after decoding, so the ids have to be looked up again
+            tokens = predictions["tokens"]
+            tokens = tf.squeeze(tokens, axis=[1])
+            tokens = tf.where(tf.equal(tokens, "</s>"), tf.fill(tf.shape(tokens), ""), tokens)
+            ids = self.labels_inputter.tokens_to_ids.lookup(tokens)
         if self.labels_inputter.mark_start or self.labels_inputter.mark_end:
             ids, length = add_sequence_controls(
                 ids,
@@ -226,6 +239,7 @@ class SILTransformer(Transformer):
         encoder_state,
         encoder_sequence_length,
         tflite_run=False,
+        return_ids=False,
     ):
         params = self.params
         batch_size = tf.shape(tf.nest.flatten(encoder_outputs)[0])[0]
@@ -341,6 +355,9 @@ class SILTransformer(Transformer):
         else:
             predictions["tokens"] = target_tokens
             predictions["length"] = sampled_length
+            # the sampled ids only match the tokens if the tokens were not replaced or noised
+            if return_ids and not params.get("replace_unknown_target", False) and not decoding_noise:
+                predictions["ids"] = sampled_ids
             if alignment is not None:
                 predictions["alignment"] = alignment
 
@@ -353,7 +370,7 @@ class SILTransformer(Transformer):
                 predictions[key] = value[:, :num_hypotheses]
         return predictions
 
-    def batch_find_trg_entries(self, src_ids: tf.Tensor, ref: tf.RaggedTensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    def batch_find_trg_entries(self, src_ids: tf.Tensor, ref: tf.RaggedTensor) -> Tuple[tf.Tensor, tf.RaggedTensor]:
         if self._dictionary is None:
             raise ValueError("The dictionary must be initialized.")
         ref_id = self._dictionary.get_ref_id(ref)
@@ -365,9 +382,9 @@ class SILTransformer(Transformer):
                 tf.RaggedTensorSpec(shape=(None, None, None), dtype=tf.int32, row_splits_dtype=tf.int32),
             ),
         )
-        return src_entry_indices, trg_entries.to_tensor()
+        return src_entry_indices, trg_entries
 
-    @tf.function
+    @tf.function(experimental_relax_shapes=True)
     def find_trg_entries(self, src_ids: tf.Tensor, ref_id: tf.Tensor) -> Tuple[tf.Tensor, tf.RaggedTensor]:
         if self._dictionary is None:
             raise ValueError("The dictionary must be initialized.")
@@ -479,6 +496,19 @@ class SILTransformer(Transformer):
         )
 
 
+def lookup_entry_ids(inputter: WordEmbedder, entries: List[List[str]]) -> List[List[tf.Tensor]]:
+    """Converts the variants of all dictionary entries to ids with a single vocabulary lookup."""
+    variants = [variant for entry in entries for variant in entry]
+    features = inputter.make_features(tf.constant(variants))
+    variant_ids = tf.RaggedTensor.from_tensor(features["ids"], lengths=features["length"])
+    entry_ids: List[List[tf.Tensor]] = []
+    start = 0
+    for entry in entries:
+        entry_ids.append([variant_ids[i] for i in range(start, start + len(entry))])
+        start += len(entry)
+    return entry_ids
+
+
 class SILSequenceToSequenceInputter(SequenceToSequenceInputter):
     def __init__(self, features_inputter, labels_inputter, share_parameters=False):
         super().__init__(features_inputter, labels_inputter, share_parameters)
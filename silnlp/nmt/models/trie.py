@@ -8,18 +8,17 @@ from scipy.sparse import dok_matrix
 class Trie(tf.Module):
     def __init__(
         self,
-        num_states: int,
-        data: tf.Tensor,
-        indices: tf.Tensor,
-        indptr: tf.Tensor,
+        vocab_size: int,
+        transition_keys: tf.Tensor,
+        transition_values: tf.Tensor,
         states: tf.RaggedTensor,
         ref_ids: tf.RaggedTensor,
         ref_ids_lookup: Dict[str, int],
     ) -> None:
-        self._num_states = tf.Variable([num_states], trainable=False)
-        self._data = tf.Variable(data, trainable=False)
-        self._indices = tf.Variable(indices, trainable=False)
-        self._indptr = tf.Variable(indptr, trainable=False)
+        self._vocab_size = tf.constant(vocab_size, dtype=tf.int64)
+        # transitions are keyed by (state * vocab_size + id), so each step of a prefix walk is a single hash probe
+        transitions_initializer = tf.lookup.KeyValueTensorInitializer(transition_keys, transition_values)
+        self._transitions = tf.lookup.StaticHashTable(transitions_initializer, default_value=0)
         self._states = tf.Variable(states.to_tensor(), trainable=False)
         self._ref_ids = tf.Variable(ref_ids.to_tensor(), trainable=False)
 
@@ -42,15 +41,8 @@ class Trie(tf.Module):
         i = 0
         for id in ids:
             tf.autograph.experimental.set_loop_options(shape_invariants=[(value, tf.TensorShape((None, None)))])
-            col_start = self._indptr[id]
-            col_end = self._indptr[id + 1]
-            if col_start == col_end:
-                break
-            col_indices = tf.reshape(self._indices[col_start:col_end], (-1, 1))
-            col_data = self._data[col_start:col_end]
-
-            col = tf.scatter_nd(col_indices, col_data, self._num_states)
-            cur_state = col[cur_state]
+            key = tf.cast(cur_state, tf.int64) * self._vocab_size + tf.cast(id, tf.int64)
+            cur_state = self._transitions.lookup(key)
             if cur_state == 0:
                 break
             else:
@@ -125,12 +117,20 @@ class TrieCompiler:
             cur_state = next_state
 
     def compile(self) -> Trie:
-        csc_matrix = self._build_matrix.tocsc()
-        data = tf.constant(csc_matrix.data)
-        indices = tf.constant(csc_matrix.indices)
-        indptr = tf.constant(csc_matrix.indptr)
+        transitions = self._build_matrix
+        keys = np.fromiter(
+            (state * self._vocab_size + id for state, id in transitions.keys()), dtype=np.int64, count=len(transitions)
+        )
+        values = np.fromiter(transitions.values(), dtype=np.int32, count=len(transitions))
 
         states = tf.ragged.stack(self._build_states)
         ref_ids = tf.ragged.stack(self._build_ref_ids)
 
-        return Trie(self._num_states, data, indices, indptr, states, ref_ids, self._build_ref_lookup)
+        return Trie(
+            self._vocab_size,
+            tf.constant(keys),
+            tf.constant(values),
+            states,
+            ref_ids,
+            self._build_ref_lookup,
+        )
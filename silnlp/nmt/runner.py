@@ -9,6 +9,7 @@ from opennmt.data import Vocab, inference_pipeline
 from opennmt.models import Model, SequenceToSequence
 from opennmt.utils.checkpoint import Checkpoint
 from opennmt.utils.misc import OrderRestorer, extract_batches, item_or_tuple
+from tensorflow.python.eager.def_function import Function
 
 from .models.sil_self_attention_decoder import SILSelfAttentionDecoder
 from .models.sil_transformer import SILTransformer
@@ -173,6 +174,14 @@ def make_inference_dataset(
 
 
 class SILRunner(Runner):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # the restored inference model and its traced function are reused by later infer_list() calls
+        self._infer_checkpoint_path: Optional[str] = None
+        self._infer_model: Optional[Model] = None
+        self._infer_fn: Optional[Function] = None
+        self._infer_spec: Any = None
+
     def _finalize_config(self, training=False, num_replicas=1, num_devices=1):
         config = super()._finalize_config(training, num_replicas, num_devices)
         if training and not config["eval"].get("use_dictionary", True):
@@ -304,22 +313,34 @@ class SILRunner(Runner):
 
     def infer_list(self, features_list: List[List[str]], checkpoint_path: Optional[str] = None) -> List[List[str]]:
         config = self._finalize_config()
-        model: Model = self._init_model(config)
-        checkpoint = Checkpoint.from_config(config, model)
-        checkpoint.restore(checkpoint_path=checkpoint_path, weights_only=True)
+        if checkpoint_path is None:
+            checkpoint_path = tf.train.latest_checkpoint(config["model_dir"])
+        model = self._infer_model
+        if model is None or checkpoint_path != self._infer_checkpoint_path:
+            model = self._init_model(config)
+            checkpoint = Checkpoint.from_config(config, model)
+            checkpoint.restore(checkpoint_path=checkpoint_path, weights_only=True)
+            self._infer_checkpoint_path = checkpoint_path
+            self._infer_model = model
+            self._infer_fn = None
         infer_config = config["infer"]
         dataset = make_inference_dataset(
             model,
             features_list,
             infer_config["batch_size"],
+            batch_type=infer_config.get("batch_type", "examples"),
             length_bucket_width=infer_config["length_bucket_width"],
             prefetch_buffer_size=infer_config.get("prefetch_buffer_size"),
         )
 
-        infer_fn = tf.function(model.infer, input_signature=(dataset.element_spec,))
-        if not tf.config.functions_run_eagerly():
-            tf.get_logger().info("Tracing and optimizing the inference graph...")
-            infer_fn.get_concrete_function()  # Trace the function now.
+        infer_fn = self._infer_fn
+        if infer_fn is None or dataset.element_spec != self._infer_spec:
+            self._infer_spec = dataset.element_spec
+            infer_fn = tf.function(model.infer, input_signature=(self._infer_spec,))
+            self._infer_fn = infer_fn
+            if not tf.config.functions_run_eagerly():
+                tf.get_logger().info("Tracing and optimizing the inference graph...")
+                infer_fn.get_concrete_function()  # Trace the function now.
 
         results: List[List[str]] = [[""]] * len(features_list[0])
         for source in dataset:
@@ -351,19 +372,25 @@ class SILRunner(Runner):
         checkpoint = Checkpoint.from_config(config, model)
         checkpoint.restore(checkpoint_path=checkpoint_path, weights_only=True)
         infer_config = config["infer"]
+        # the inference function is traced once and reused for every file with the same input signature
+        infer_fn: Optional[Function] = None
+        infer_spec: Any = None
         for features_path, predictions_path in zip(features_paths, predictions_paths):
             dataset = model.examples_inputter.make_inference_dataset(
                 features_path,
                 infer_config["batch_size"],
+                batch_type=infer_config.get("batch_type", "examples"),
                 length_bucket_width=infer_config["length_bucket_width"],
                 prefetch_buffer_size=infer_config.get("prefetch_buffer_size"),
             )
 
             with open(predictions_path, encoding="utf-8", mode="w") as stream:
-                infer_fn = tf.function(model.infer, input_signature=(dataset.element_spec,))
-                if not tf.config.functions_run_eagerly():
-                    tf.get_logger().info("Tracing and optimizing the inference graph...")
-                    infer_fn.get_concrete_function()  # Trace the function now.
+                if infer_fn is None or dataset.element_spec != infer_spec:
+                    infer_spec = dataset.element_spec
+                    infer_fn = tf.function(model.infer, input_signature=(infer_spec,))
+                    if not tf.config.functions_run_eagerly():
+                        tf.get_logger().info("Tracing and optimizing the inference graph...")
+                        infer_fn.get_concrete_function()  # Trace the function now.
 
                 # Inference might return out-of-order predictions. The OrderRestorer utility is
                 # used to write predictions in their original order.
@@ -1,27 +1,36 @@
 import argparse
 import logging
+import multiprocessing
+import os
 import random
 import sys
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
 from pathlib import Path
 from typing import IO, Dict, Iterable, List, Optional, Set, Tuple, Union, cast, Sequence
 
-import numpy as np
-import sacrebleu
 import tensorflow as tf
-from machine.scripture import ORIGINAL_VERSIFICATION, VerseRef, book_number_to_id, get_books
-from sacrebleu.metrics import BLEU, BLEUScore
+from machine.scripture import book_id_to_number, book_number_to_id, get_books
+from sacrebleu.metrics import BLEU, CHRF, BLEUScore
 
+from ..common.corpus import write_corpus
 from ..common.metrics import compute_meteor_score, compute_ter_score, compute_wer_score
 from ..common.utils import get_git_revision_hash
 from .config import Config, create_runner, load_config
-from .utils import decode_sp, enable_memory_growth, get_best_model_dir, get_last_checkpoint
+from .utils import decode_sp, enable_memory_growth, get_best_model_dir, get_last_checkpoint, get_trg_tag_iso
 
 LOGGER = logging.getLogger(__name__)
 
 _SUPPORTED_SCORERS = {"bleu", "sentencebleu", "chrf3", "meteor", "wer", "ter"}
 
+_READ_BUFFER_SIZE = 1 << 20
+_WRITE_BUFFER_SIZE = 1 << 20
+
 
 class PairScore:
+    __slots__ = ("src_iso", "trg_iso", "bleu", "sent_len", "num_refs", "refs", "other_scores", "book")
+
     def __init__(
         self,
         book: str,
@@ -30,7 +39,7 @@ class PairScore:
         bleu: Optional[BLEUScore],
         sent_len: int,
         projects: Set[str],
-        other_scores: Dict[str, float] = {},
+        other_scores: Optional[Dict[str, float]] = None,
     ) -> None:
         self.src_iso = src_iso
         self.trg_iso = trg_iso
@@ -38,155 +47,134 @@ class PairScore:
         self.sent_len = sent_len
         self.num_refs = len(projects)
         self.refs = "_".join(sorted(projects))
-        self.other_scores = other_scores
+        self.other_scores = {} if other_scores is None else other_scores
         self.book = book
 
     def writeHeader(self, file: IO) -> None:
         file.write("book,src_iso,trg_iso,num_refs,references,sent_len,scorer,score\n")
 
     def write(self, file: IO) -> None:
+        prefix = f"{self.book},{self.src_iso},{self.trg_iso},{self.num_refs},{self.refs},{self.sent_len:d},"
+        rows: List[str] = []
         if self.bleu is not None:
-            file.write(f"{self.book},{self.src_iso},{self.trg_iso},{self.num_refs},{self.refs},{self.sent_len:d},")
-            file.write(
-                f"BLEU,{self.bleu.score:.2f}/{self.bleu.precisions[0]:.2f}/{self.bleu.precisions[1]:.2f}/"
+            rows.append(
+                f"{prefix}BLEU,{self.bleu.score:.2f}/{self.bleu.precisions[0]:.2f}/{self.bleu.precisions[1]:.2f}/"
                 f"{self.bleu.precisions[2]:.2f}/{self.bleu.precisions[3]:.2f}/{self.bleu.bp:.3f}/"
                 f"{self.bleu.sys_len:d}/{self.bleu.ref_len:d}\n"
             )
             tf.summary.scalar(f"{self.book}/BLEU", self.bleu.score)
         for key, val in self.other_scores.items():
-            file.write(f"{self.book},{self.src_iso},{self.trg_iso},{self.num_refs},{self.refs},{self.sent_len:d},")
-            file.write(f"{key},{val:.2f}\n")
+            rows.append(f"{prefix}{key},{val:.2f}\n")
             tf.summary.scalar(f"{self.book}/{key}", val)
+        file.write("".join(rows))
+
+
+@lru_cache(maxsize=None)
+def get_corpus_bleu_metric(tokenize: str) -> BLEU:
+    # the same settings as sacrebleu.corpus_bleu(lowercase=True), but the tokenizer is only created once per process
+    return BLEU(lowercase=True, tokenize=tokenize)
+
+
+@lru_cache(maxsize=None)
+def get_corpus_chrf3_metric() -> CHRF:
+    # the same settings as sacrebleu.corpus_chrf(char_order=6, beta=3, remove_whitespace=True)
+    return CHRF(char_order=6, beta=3, whitespace=False)
 
 
-def score_individual_books(
+def score_pair(
+    book: str,
+    src_iso: str,
+    trg_iso: str,
+    pair_sys: List[str],
+    pair_refs: List[List[str]],
+    scorers: Set[str],
+    ref_projects: Set[str],
+    sacrebleu_tokenize: str,
+) -> PairScore:
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # METEOR runs in a Java subprocess, so it is computed while the other scorers run in this thread
+        meteor_future: Optional[Future] = None
+        if "meteor" in scorers:
+            meteor_future = executor.submit(
+                compute_meteor_score, trg_iso, pair_sys, cast(List[Iterable[str]], pair_refs)
+            )
+
+        bleu_score = None
+        if "bleu" in scorers:
+            bleu_score = get_corpus_bleu_metric(sacrebleu_tokenize).corpus_score(
+                pair_sys, cast(Sequence[Sequence[str]], pair_refs)
+            )
+
+        other_scores: Dict[str, float] = {}
+        if "chrf3" in scorers:
+            chrf3_score = get_corpus_chrf3_metric().corpus_score(pair_sys, cast(Sequence[Sequence[str]], pair_refs))
+            # scaled and rounded half to even, the same as np.round(score, 2)
+            other_scores["CHRF3"] = round(chrf3_score.score * 100) / 100
+
+        wer_score = -1.0
+        if "wer" in scorers:
+            wer_score = compute_wer_score(pair_sys, cast(List[str], pair_refs))
+
+        ter_score = -1.0
+        if "ter" in scorers:
+            ter_score = compute_ter_score(pair_sys, cast(List[Iterable[str]], pair_refs))
+
+        if meteor_future is not None:
+            meteor_score = meteor_future.result()
+            if meteor_score is not None:
+                other_scores["METEOR"] = meteor_score
+    if wer_score >= 0:
+        other_scores["WER"] = wer_score
+    if ter_score >= 0:
+        other_scores["TER"] = ter_score
+    return PairScore(book, src_iso, trg_iso, bleu_score, len(pair_sys), ref_projects, other_scores)
+
+
+def score_pairs(score_args: List[tuple], sentence_bleu_args: List[tuple]) -> List[PairScore]:
+    # the scorers are mostly pure Python, so the pairs (and books) are scored in separate processes
+    if len(score_args) + len(sentence_bleu_args) <= 1:
+        for args in sentence_bleu_args:
+            write_sentence_bleu(*args)
+        return [score_pair(*args) for args in score_args]
+    # the workers are spawned, since forking a process that has already run TensorFlow inference is not safe
+    with ProcessPoolExecutor(
+        min(len(score_args) + len(sentence_bleu_args), os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        sentence_bleu_futures = [executor.submit(write_sentence_bleu, *args) for args in sentence_bleu_args]
+        futures = [executor.submit(score_pair, *args) for args in score_args]
+        for future in sentence_bleu_futures:
+            future.result()
+        return [future.result() for future in futures]
+
+
+def get_individual_book_score_args(
     book_dict: dict,
     src_iso: str,
     predictions_detok_path: str,
     scorers: Set[str],
     config: Config,
     ref_projects: Set[str],
-):
-    overall_sys: List[str] = []
-    book_scores: List[PairScore] = []
-
+    sentence_bleu_args: Dict[str, tuple],
+) -> List[tuple]:
+    sacrebleu_tokenize: str = config.data.get("sacrebleu_tokenize", "13a")
+    score_args: List[tuple] = []
     for book in book_dict.keys():
         for trg_iso, book_tuple in book_dict[book].items():
             pair_sys = book_tuple[0]
             pair_refs = book_tuple[1]
-            overall_sys.extend(pair_sys)
-
-            bleu_score = None
-            if "bleu" in scorers:
-                bleu_score = sacrebleu.corpus_bleu(
-                    pair_sys,
-                    pair_refs,
-                    lowercase=True,
-                    tokenize=config.data.get("sacrebleu_tokenize", "13a"),
-                )
 
             if "sentencebleu" in scorers:
-                write_sentence_bleu(
+                sentence_bleu_args[predictions_detok_path] = (
                     predictions_detok_path,
                     pair_sys,
                     pair_refs,
-                    lowercase=True,
-                    tokenize=config.data.get("sacrebleu_tokenize", "13a"),
+                    True,
+                    sacrebleu_tokenize,
                 )
 
-            other_scores: Dict[str, float] = {}
-            if "chrf3" in scorers:
-                chrf3_score = sacrebleu.corpus_chrf(pair_sys, pair_refs, char_order=6, beta=3, remove_whitespace=True)
-                other_scores["CHRF3"] = np.round(float(chrf3_score.score), 2)
-
-            if "meteor" in scorers:
-                meteor_score = compute_meteor_score(trg_iso, pair_sys, pair_refs)
-                if meteor_score is not None:
-                    other_scores["METEOR"] = meteor_score
-
-            if "wer" in scorers:
-                wer_score = compute_wer_score(pair_sys, cast(List[str], pair_refs))
-                if wer_score >= 0:
-                    other_scores["WER"] = wer_score
-
-            if "ter" in scorers:
-                ter_score = compute_ter_score(pair_sys, pair_refs)
-                if ter_score >= 0:
-                    other_scores["TER"] = ter_score
-            score = PairScore(book, src_iso, trg_iso, bleu_score, len(pair_sys), ref_projects, other_scores)
-            book_scores.append(score)
-    return book_scores
-
-
-def process_individual_books(
-    src_file_path: Path,
-    pred_file_path: Path,
-    ref_file_paths: List[Path],
-    vref_file_path: Path,
-    default_trg_iso: str,
-    select_rand_ref_line: bool,
-    books: Set[int],
-):
-    # Output data structure
-    book_dict: Dict[str, dict] = {}
-    ref_files = []
-
-    try:
-        # Get all references
-        for ref_file_path in ref_file_paths:
-            file = ref_file_path.open("r", encoding="utf-8")
-            ref_files.append(file)
-
-        with vref_file_path.open("r", encoding="utf-8") as vref_file, pred_file_path.open(
-            "r", encoding="utf-8"
-        ) as pred_file, src_file_path.open("r", encoding="utf-8") as src_file:
-            for lines in zip(pred_file, vref_file, src_file, *ref_files):
-                # Get file lines
-                pred_line = lines[0].strip()
-                detok_pred = decode_sp(pred_line)
-                vref = lines[1].strip()
-                src_line = lines[2].strip()
-                # Get book
-                if vref != "":
-                    vref = VerseRef.from_string(vref.strip(), ORIGINAL_VERSIFICATION)
-                    # Check if book in books
-                    if vref.book_num in books:
-                        # Get iso
-                        book_iso = default_trg_iso
-                        if src_line.startswith("<2"):
-                            index = src_line.index(">")
-                            val = src_line[2:index]
-                            if val != "qaa":
-                                book_iso = val
-                        # If book not in dictionary add the book
-                        if vref.book not in book_dict:
-                            book_dict[vref.book] = {}
-                        if book_iso not in book_dict[vref.book]:
-                            book_dict[vref.book][book_iso] = ([], [])
-                        book_pred, book_refs = book_dict[vref.book][book_iso]
-
-                        # Add detokenized prediction to nested dictionary
-                        book_pred.append(detok_pred)
-
-                        # Check if random ref line selected or not
-                        if select_rand_ref_line:
-                            ref_index = random.randint(0, len(ref_files) - 1)
-                            ref_line = lines[ref_index + 3].strip()
-                            if len(book_refs) == 0:
-                                book_refs.append([])
-                            book_refs[0].append(ref_line)
-                        else:
-                            # For each reference text, add to book_refs
-                            for ref_index in range(len(ref_files)):
-                                ref_line = lines[ref_index + 3].strip()
-                                if len(book_refs) == ref_index:
-                                    book_refs.append([])
-                                book_refs[ref_index].append(ref_line)
-    finally:
-        if ref_files is not None:
-            for ref_file in ref_files:
-                ref_file.close()
-    return book_dict
+            score_args.append((book, src_iso, trg_iso, pair_sys, pair_refs, scorers, ref_projects, sacrebleu_tokenize))
+    return score_args
 
 
 def load_test_data(
@@ -203,9 +191,11 @@ def load_test_data(
     dataset: Dict[str, Tuple[List[str], List[List[str]]]] = {}
     src_file_path = config.exp_dir / src_file_name
     pred_file_path = config.exp_dir / pred_file_name
-    with src_file_path.open("r", encoding="utf-8") as src_file, pred_file_path.open(
-        "r", encoding="utf-8"
-    ) as pred_file, (config.exp_dir / output_file_name).open("w", encoding="utf-8") as out_file:
+    # the input files are read as bytes, so that only the lines of the selected books are decoded
+    detok_pred_lines: List[str] = []
+    with src_file_path.open("rb", buffering=_READ_BUFFER_SIZE) as src_file, pred_file_path.open(
+        "rb", buffering=_READ_BUFFER_SIZE
+    ) as pred_file:
         ref_file_paths = list(config.exp_dir.glob(ref_pattern))
         select_rand_ref_line = False
         if len(ref_file_paths) > 1:
@@ -216,65 +206,68 @@ def load_test_data(
             else:
                 # use specified refs only
                 ref_file_paths = [p for p in ref_file_paths if config.is_ref_project(ref_projects, p)]
-        ref_files: List[IO] = []
-        vref_file: Optional[IO] = None
-        vref_file_path = config.exp_dir / vref_file_name
-        if len(books) > 0 and vref_file_path.is_file():
-            vref_file = vref_file_path.open("r", encoding="utf-8")
-        try:
-            for ref_file_path in ref_file_paths:
-                ref_files.append(ref_file_path.open("r", encoding="utf-8"))
+        with ExitStack() as stack:
+            vref_file: Optional[IO] = None
+            vref_file_path = config.exp_dir / vref_file_name
+            if len(books) > 0 and vref_file_path.is_file():
+                vref_file = stack.enter_context(vref_file_path.open("rb", buffering=_READ_BUFFER_SIZE))
+            ref_files: List[IO] = [
+                stack.enter_context(p.open("rb", buffering=_READ_BUFFER_SIZE)) for p in ref_file_paths
+            ]
             default_trg_iso = config.default_trg_iso
+            # a randomly selected reference line is stored as a single reference
+            num_refs = 1 if select_rand_ref_line else len(ref_files)
+            book_dict: Dict[str, dict] = {}
+            # the random reference lines for the books are selected after all of the pair lines, so that the random
+            # numbers are drawn in the same order as when the books were loaded in a separate pass
+            book_rand_ref_lines: List[Tuple[List[str], List[str]]] = []
             for lines in zip(src_file, pred_file, *ref_files):
+                book: Optional[str] = None
                 if vref_file is not None:
-                    vref_line = vref_file.readline().strip()
+                    vref_line = vref_file.readline().decode("utf-8").strip()
                     if vref_line != "":
-                        vref = VerseRef.from_string(vref_line, ORIGINAL_VERSIFICATION)
-                        if vref.book_num not in books:
+                        # only the book is needed, so the rest of the verse reference is not parsed
+                        book_num = book_id_to_number(vref_line.split(" ", 1)[0].upper())
+                        if book_num not in books:
                             continue
-                src_line = lines[0].strip()
-                pred_line = lines[1].strip()
+                        book = book_number_to_id(book_num)
+                src_line = lines[0].decode("utf-8").strip()
+                pred_line = lines[1].decode("utf-8").strip()
                 detok_pred_line = decode_sp(pred_line)
-                iso = default_trg_iso
-                if src_line.startswith("<2"):
-                    index = src_line.index(">")
-                    val = src_line[2:index]
-                    if val != "qaa":
-                        iso = val
+                iso = get_trg_tag_iso(src_line, default_trg_iso)
                 if iso not in dataset:
-                    dataset[iso] = ([], [])
+                    dataset[iso] = ([], [[] for _ in range(num_refs)])
                 sys, refs = dataset[iso]
                 sys.append(detok_pred_line)
                 if select_rand_ref_line:
-                    ref_lines: List[str] = [l for l in map(lambda l: l.strip(), lines[2:]) if len(l) > 0]
+                    all_ref_lines = [l.decode("utf-8").strip() for l in lines[2:]]
+                    ref_lines: List[str] = [l for l in all_ref_lines if len(l) > 0]
                     ref_index = random.randint(0, len(ref_lines) - 1)
                     ref_line = ref_lines[ref_index]
-                    if len(refs) == 0:
-                        refs.append([])
                     refs[0].append(ref_line)
                 else:
                     for ref_index in range(len(ref_files)):
-                        ref_line = lines[ref_index + 2].strip()
-                        if len(refs) == ref_index:
-                            refs.append([])
+                        ref_line = lines[ref_index + 2].decode("utf-8").strip()
                         refs[ref_index].append(ref_line)
-                out_file.write(detok_pred_line + "\n")
-            book_dict: Dict[str, dict] = {}
-            if by_book:
-                book_dict = process_individual_books(
-                    src_file_path,
-                    pred_file_path,
-                    ref_file_paths,
-                    vref_file_path,
-                    default_trg_iso,
-                    select_rand_ref_line,
-                    books,
-                )
-        finally:
-            if vref_file is not None:
-                vref_file.close()
-            for ref_file in ref_files:
-                ref_file.close()
+                detok_pred_lines.append(detok_pred_line)
+
+                if by_book and book is not None:
+                    if book not in book_dict:
+                        book_dict[book] = {}
+                    if iso not in book_dict[book]:
+                        book_dict[book][iso] = ([], [[] for _ in range(num_refs)])
+                    book_pred, book_refs = book_dict[book][iso]
+                    book_pred.append(detok_pred_line)
+                    if select_rand_ref_line:
+                        # unlike the pair references, empty reference lines can be selected for the books
+                        book_rand_ref_lines.append((book_refs[0], all_ref_lines))
+                    else:
+                        for ref_index in range(len(ref_files)):
+                            book_refs[ref_index].append(refs[ref_index][-1])
+            for book_ref, book_ref_lines in book_rand_ref_lines:
+                ref_index = random.randint(0, len(book_ref_lines) - 1)
+                book_ref.append(book_ref_lines[ref_index])
+    write_corpus(config.exp_dir / output_file_name, detok_pred_lines)
     return dataset, book_dict
 
 
@@ -291,7 +284,18 @@ def sentence_bleu(
     Substitute for the sacrebleu version of sentence_bleu, which uses settings that aren't consistent with
     the values we use for corpus_bleu, and isn't fully parameterized
     """
-    metric = BLEU(
+    metric = create_sentence_bleu_metric(smooth_method, smooth_value, lowercase, tokenize, use_effective_order)
+    return metric.sentence_score(hypothesis, references)
+
+
+def create_sentence_bleu_metric(
+    smooth_method: str = "exp",
+    smooth_value: float = None,
+    lowercase: bool = False,
+    tokenize: str = "13a",
+    use_effective_order: bool = True,
+) -> BLEU:
+    return BLEU(
         smooth_method=smooth_method,
         smooth_value=smooth_value,
         force=False,
@@ -299,7 +303,6 @@ def sentence_bleu(
         tokenize=tokenize,
         effective_order=use_effective_order,
     )
-    return metric.sentence_score(hypothesis, references)
 
 
 def write_sentence_bleu(
@@ -310,24 +313,35 @@ def write_sentence_bleu(
     tokenize: str = "13a",
 ):
     scores_path = predictions_detok_path + ".scores.csv"
-    with open(scores_path, "w", encoding="utf-8-sig") as scores_file:
-        scores_file.write("Verse\tBLEU\t1-gram\t2-gram\t3-gram\t4-gram\tBP\tPrediction")
-        for ref in refs:
-            scores_file.write("\tReference")
-        scores_file.write("\n")
+    with open(scores_path, "w", encoding="utf-8-sig", buffering=_WRITE_BUFFER_SIZE) as scores_file:
+        scores_file.write(
+            "Verse\tBLEU\t1-gram\t2-gram\t3-gram\t4-gram\tBP\tPrediction" + "\tReference" * len(refs) + "\n"
+        )
+        # the metric is only created once, so that its tokenizer (and the tokenizer's cache) is reused for every verse
+        metric = create_sentence_bleu_metric(lowercase=lowercase, tokenize=tokenize)
         verse_num = 0
         for pred in preds:
             sentences: List[str] = []
             for ref in refs:
                 sentences.append(ref[verse_num])
-            bleu = sentence_bleu(pred, sentences, lowercase=lowercase, tokenize=tokenize)
+            bleu = metric.sentence_score(pred, sentences)
+            # each row is written with a single call
             scores_file.write(
-                f"{verse_num + 1}\t{bleu.score:.2f}\t{bleu.precisions[0]:.2f}\t{bleu.precisions[1]:.2f}\t"
-                f"{bleu.precisions[2]:.2f}\t{bleu.precisions[3]:.2f}\t{bleu.bp:.3f}\t" + pred.rstrip("\n")
+                "\t".join(
+                    [
+                        str(verse_num + 1),
+                        f"{bleu.score:.2f}",
+                        f"{bleu.precisions[0]:.2f}",
+                        f"{bleu.precisions[1]:.2f}",
+                        f"{bleu.precisions[2]:.2f}",
+                        f"{bleu.precisions[3]:.2f}",
+                        f"{bleu.bp:.3f}",
+                        pred.rstrip("\n"),
+                        *(sentence.rstrip("\n") for sentence in sentences),
+                    ]
+                )
+                + "\n"
             )
-            for sentence in sentences:
-                scores_file.write("\t" + sentence.rstrip("\n"))
-            scores_file.write("\n")
             verse_num += 1
 
 
@@ -361,14 +375,15 @@ def test_checkpoint(
         refs_patterns.append("test.trg.detok*.txt")
         predictions_detok_file_names.append(f"test.trg-predictions.detok.txt.{suffix_str}")
     else:
-        # test data is split into separate files
+        # test data is split into separate files, so list the experiment directory once instead of checking each pair
+        exp_file_names = {entry.name for entry in os.scandir(config.exp_dir) if entry.is_file()}
         for src_iso in sorted(config.src_isos):
             for trg_iso in sorted(config.trg_isos):
                 if src_iso == trg_iso:
                     continue
                 prefix = f"test.{src_iso}.{trg_iso}"
                 features_file_name = f"{prefix}.src.txt"
-                if (config.exp_dir / features_file_name).is_file():
+                if features_file_name in exp_file_names:
                     vref_paths.append(f"{prefix}.vref.txt")
                     features_file_names.append(features_file_name)
                     predictions_file_names.append(f"{prefix}.trg-predictions.txt.{suffix_str}")
@@ -396,7 +411,10 @@ def test_checkpoint(
 
     print(f"Scoring {checkpoint_name}...")
     default_src_iso = config.default_src_iso
-    scores: List[PairScore] = []
+    sacrebleu_tokenize: str = config.data.get("sacrebleu_tokenize", "13a")
+    score_args: List[tuple] = []
+    # each pair and book writes its sentence BLEU scores to the same file for a test file, so only the last one is kept
+    sentence_bleu_args: Dict[str, tuple] = {}
     overall_sys: List[str] = []
     overall_refs: List[List[str]] = []
     for vref_file_name, features_file_name, predictions_file_name, refs_pattern, predictions_detok_file_name in zip(
@@ -422,62 +440,44 @@ def test_checkpoint(
             overall_sys.extend(pair_sys)
             for i, ref in enumerate(pair_refs):
                 if i == len(overall_refs):
-                    overall_refs.append([""] * start_index)
-                overall_refs[i].extend(ref)
-            # ensure that all refs are the same length as the sys
-            for overall_ref in filter(lambda r: len(r) < len(overall_sys), overall_refs):
-                overall_ref.extend([""] * (len(overall_sys) - len(overall_ref)))
-            bleu_score = None
-            if "bleu" in scorers:
-                bleu_score = sacrebleu.corpus_bleu(
-                    pair_sys,
-                    cast(Sequence[Sequence[str]], pair_refs),
-                    lowercase=True,
-                    tokenize=config.data.get("sacrebleu_tokenize", "13a"),
-                )
+                    overall_refs.append([])
+                overall_ref = overall_refs[i]
+                # pad the ref for the previous pairs that did not have it
+                if len(overall_ref) < start_index:
+                    overall_ref.extend([""] * (start_index - len(overall_ref)))
+                overall_ref.extend(ref)
 
             if "sentencebleu" in scorers:
-                write_sentence_bleu(
+                sentence_bleu_args[predictions_detok_file_name] = (
                     predictions_detok_file_name,
                     pair_sys,
                     cast(List[List[str]], pair_refs),
-                    lowercase=True,
-                    tokenize=config.data.get("sacrebleu_tokenize", "13a"),
+                    True,
+                    sacrebleu_tokenize,
                 )
 
-            other_scores: Dict[str, float] = {}
-            if "chrf3" in scorers:
-                chrf3_score = sacrebleu.corpus_chrf(
-                    pair_sys, cast(Sequence[Sequence[str]], pair_refs), char_order=6, beta=3, remove_whitespace=True
-                )
-                other_scores["CHRF3"] = np.round(float(chrf3_score.score), 2)
-
-            if "meteor" in scorers:
-                meteor_score = compute_meteor_score(trg_iso, pair_sys, cast(List[Iterable[str]], pair_refs))
-                if meteor_score is not None:
-                    other_scores["METEOR"] = meteor_score
-
-            if "wer" in scorers:
-                wer_score = compute_wer_score(pair_sys, cast(List[str], pair_refs))
-                if wer_score >= 0:
-                    other_scores["WER"] = wer_score
-
-            if "ter" in scorers:
-                ter_score = compute_ter_score(pair_sys, cast(List[Iterable[str]], pair_refs))
-                if ter_score >= 0:
-                    other_scores["TER"] = ter_score
-
-            scores.append(PairScore("ALL", src_iso, trg_iso, bleu_score, len(pair_sys), ref_projects, other_scores))
+            score_args.append(("ALL", src_iso, trg_iso, pair_sys, pair_refs, scorers, ref_projects, sacrebleu_tokenize))
             if by_book is True:
                 if len(book_dict) != 0:
-                    book_scores = score_individual_books(
-                        book_dict, src_iso, predictions_detok_file_name, scorers, config, ref_projects
+                    score_args.extend(
+                        get_individual_book_score_args(
+                            book_dict,
+                            src_iso,
+                            predictions_detok_file_name,
+                            scorers,
+                            config,
+                            ref_projects,
+                            sentence_bleu_args,
+                        )
                     )
-                    scores.extend(book_scores)
                 else:
                     print("Error: book_dict did not load correctly. Not scoring individual books.")
+    scores = score_pairs(score_args, list(sentence_bleu_args.values()))
+    # ensure that all refs are the same length as the sys
+    for overall_ref in overall_refs:
+        overall_ref.extend([""] * (len(overall_sys) - len(overall_ref)))
     if len(config.src_isos) > 1 or len(config.trg_isos) > 1:
-        bleu = sacrebleu.corpus_bleu(overall_sys, cast(Sequence[Sequence[str]], overall_refs), lowercase=True)
+        bleu = get_corpus_bleu_metric("13a").corpus_score(overall_sys, cast(Sequence[Sequence[str]], overall_refs))
         scores.append(PairScore("ALL", "ALL", "ALL", bleu, len(overall_sys), ref_projects))
 
     scores_file_root = f"scores-{suffix_str}"
@@ -15,17 +15,17 @@ from ..common.paratext import book_file_name_digits
 from ..common.translator import Translator
 from ..common.utils import get_git_revision_hash
 from .config import Config, create_runner, get_checkpoint_path
-from .utils import decode_sp_lines, enable_memory_growth, encode_sp
+from .utils import decode_sp_lines, enable_memory_growth, encode_sp_lines
 
 LOGGER = logging.getLogger(__name__)
 
 
 class NMTTranslator(Translator):
-    def __init__(self, config: Config, checkpoint_path: Optional[Path]):
+    def __init__(self, config: Config, checkpoint_path: Optional[Path], mixed_precision: bool = False):
         self._multiple_trg_isos = len(config.trg_isos) > 1
         self._default_trg_iso = config.default_trg_iso
         self.checkpoint_path = checkpoint_path
-        self._runner = create_runner(config)
+        self._runner = create_runner(config, mixed_precision=mixed_precision)
         self._src_spp = config.create_src_sp_processor()
 
     def translate(
@@ -34,27 +34,30 @@ class NMTTranslator(Translator):
         src_iso: Optional[str] = None,
         trg_iso: Optional[str] = None,
     ) -> Iterable[str]:
+        lang_tag = self._get_lang_tag(trg_iso)
         features_list: List[List[str]] = [[]]
         for sentence in sentences:
             if isinstance(sentence, str):
-                features_list[0].append(encode_sp(self._src_spp, self._insert_lang_tag(sentence, trg_iso)))
+                features_list[0].append(lang_tag + sentence)
             else:
-                features_list[0].append(encode_sp(self._src_spp, self._insert_lang_tag(sentence[0], trg_iso)))
+                features_list[0].append(lang_tag + sentence[0])
                 for i in range(1, len(sentence)):
                     if i == len(features_list):
                         features_list.append([])
                     features_list[i].append(sentence[i])
+        # the source sentences are encoded in batches, which SentencePiece spreads over multiple threads
+        features_list[0] = list(encode_sp_lines(self._src_spp, features_list[0]))
         translations = self._runner.infer_list(
             features_list, checkpoint_path=str(self.checkpoint_path) if self.checkpoint_path is not None else None
         )
         return decode_sp_lines(t[0] for t in translations)
 
-    def _insert_lang_tag(self, text: str, trg_iso: Optional[str]) -> str:
+    def _get_lang_tag(self, trg_iso: Optional[str]) -> str:
         if self._multiple_trg_isos:
             if trg_iso is None:
                 trg_iso = self._default_trg_iso
-            return f"<2{trg_iso}> {text}"
-        return text
+            return f"<2{trg_iso}> "
+        return ""
 
 
 @dataclass
@@ -62,6 +65,7 @@ class TranslationTask:
     name: str
     checkpoint: str = "last"
     clearml_queue: Optional[str] = None
+    mixed_precision: bool = False
 
     def __post_init__(self):
         if self.checkpoint is None:
@@ -83,7 +87,9 @@ class TranslationTask:
         clearml.config.set_seed()
 
         checkpoint_path, step = get_checkpoint_path(clearml.config.model_dir, self.checkpoint)
-        translator = NMTTranslator(config=clearml.config, checkpoint_path=checkpoint_path)
+        translator = NMTTranslator(
+            config=clearml.config, checkpoint_path=checkpoint_path, mixed_precision=self.mixed_precision
+        )
         step_str = "avg" if step == -1 else str(step)
         return translator, clearml.config, step_str
 
@@ -169,6 +175,7 @@ class TranslationTask:
 def main() -> None:
     parser = argparse.ArgumentParser(description="Translates text using an NMT model")
     parser.add_argument("experiment", help="Experiment name")
+    parser.add_argument("--mixed-precision", default=False, action="store_true", help="Enable mixed precision")
     parser.add_argument("--memory-growth", default=False, action="store_true", help="Enable memory growth")
     parser.add_argument("--checkpoint", type=str, help="Checkpoint to use (last, best, avg, or checkpoint #)")
     parser.add_argument("--src", default=None, type=str, help="Source file")
@@ -210,6 +217,7 @@ def main() -> None:
         name=args.experiment,
         checkpoint=args.checkpoint,
         clearml_queue=args.clearml_queue,
+        mixed_precision=args.mixed_precision,
     )
 
     if len(args.books) > 0:
@@ -1,7 +1,11 @@
 import os
 import re
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import IO, Iterable, Iterator, List, Optional, Tuple, cast, Sequence
+from threading import Lock
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple, cast, Sequence
+from weakref import WeakKeyDictionary
 
 import sacrebleu
 import sentencepiece as sp
@@ -11,6 +15,7 @@ import numpy as np
 from opennmt.utils import Scorer, register_scorer
 
 _TAG_PATTERN = re.compile(r"(<\w+> )+")
+_TRG_TAG_PATTERN = re.compile(r"<2(\w+)>")
 
 
 def decode_sp(line: str) -> str:
@@ -24,6 +29,25 @@ def decode_sp_lines(lines: Iterable[str]) -> Iterable[str]:
     return map(decode_sp, lines)
 
 
+def get_trg_tag_iso(line: str, default_iso: str) -> str:
+    match = _TRG_TAG_PATTERN.match(line)
+    if match is None:
+        return default_iso
+    iso = match.group(1)
+    return default_iso if iso == "qaa" else iso
+
+
+def split_tag_prefix(line: str) -> Tuple[str, str]:
+    # most lines (e.g. all target lines) have no tags, so avoid running the regex on them
+    if not line.startswith("<"):
+        return "", line
+    match = _TAG_PATTERN.match(line)
+    if match is None:
+        return "", line
+    index = match.end(0)
+    return line[:index], line[index:]
+
+
 def encode_sp(
     spp: Optional[sp.SentencePieceProcessor],
     line: str,
@@ -32,12 +56,7 @@ def encode_sp(
 ) -> str:
     if spp is None:
         return line
-    prefix = ""
-    match = _TAG_PATTERN.match(line)
-    if match is not None:
-        index = match.end(0)
-        prefix = line[:index]
-        line = line[index:]
+    prefix, line = split_tag_prefix(line)
     if not add_dummy_prefix:
         line = "\ufffc" + line
     if sample_subwords:
@@ -49,13 +68,85 @@ def encode_sp(
     return prefix + " ".join(pieces)
 
 
+_ENCODE_BATCH_SIZE = 10000
+_ENCODE_CACHE_SIZE = 100000
+
+# scripture source verses are encoded once for every target project, so the most recent encodings of each model are
+# cached
+_encode_caches: "WeakKeyDictionary[sp.SentencePieceProcessor, OrderedDict[str, List[str]]]" = WeakKeyDictionary()
+# the source and target corpora can be encoded on separate threads with the same processor
+_encode_cache_lock = Lock()
+
+
+def _encode_batch(spp: sp.SentencePieceProcessor, texts: List[str]) -> List[List[str]]:
+    encoded: Dict[str, List[str]] = {}
+    with _encode_cache_lock:
+        cache = _encode_caches.get(spp)
+        if cache is None:
+            cache = OrderedDict()
+            _encode_caches[spp] = cache
+        for text in texts:
+            pieces = cache.get(text)
+            if pieces is not None:
+                cache.move_to_end(text)
+                encoded[text] = pieces
+    misses = list(dict.fromkeys(text for text in texts if text not in encoded))
+    if len(misses) > 0:
+        # the processor is not locked while encoding, so the threads can encode at the same time
+        new_encoded = dict(zip(misses, spp.Encode(misses, out_type=str)))
+        encoded.update(new_encoded)
+        with _encode_cache_lock:
+            cache.update(new_encoded)
+            while len(cache) > _ENCODE_CACHE_SIZE:
+                cache.popitem(last=False)
+    return [encoded[text] for text in texts]
+
+
 def encode_sp_lines(
     spp: Optional[sp.SentencePieceProcessor],
     lines: Iterable[str],
     add_dummy_prefix: Optional[bool] = True,
     sample_subwords: Optional[bool] = False,
 ) -> Iterator[str]:
-    return (encode_sp(spp, line, add_dummy_prefix=add_dummy_prefix, sample_subwords=sample_subwords) for line in lines)
+    if spp is None:
+        yield from lines
+        return
+    if sample_subwords:
+        for line in lines:
+            yield encode_sp(spp, line, add_dummy_prefix=add_dummy_prefix, sample_subwords=True)
+        return
+
+    for prefix, pieces in _encode_sp_pieces(spp, lines, add_dummy_prefix):
+        yield prefix + " ".join(pieces)
+
+
+def normalize_sp_lines(spp: Optional[sp.SentencePieceProcessor], lines: Iterable[str]) -> Iterator[str]:
+    # equivalent to decode_sp_lines(encode_sp_lines(spp, lines)), but the pieces are not joined with spaces that
+    # decode_sp() would remove again
+    if spp is None:
+        yield from decode_sp_lines(lines)
+        return
+
+    for prefix, pieces in _encode_sp_pieces(spp, lines, add_dummy_prefix=True):
+        yield decode_sp(prefix + "".join(pieces))
+
+
+def _encode_sp_pieces(
+    spp: sp.SentencePieceProcessor, lines: Iterable[str], add_dummy_prefix: Optional[bool]
+) -> Iterator[Tuple[str, List[str]]]:
+    it = iter(lines)
+    while True:
+        batch = list(islice(it, _ENCODE_BATCH_SIZE))
+        if len(batch) == 0:
+            break
+        prefixes: List[str] = []
+        texts: List[str] = []
+        for line in batch:
+            prefix, text = split_tag_prefix(line)
+            prefixes.append(prefix)
+            texts.append(text if add_dummy_prefix else "\ufffc" + text)
+        for prefix, pieces in zip(prefixes, _encode_batch(spp, texts)):
+            yield prefix, pieces if add_dummy_prefix else pieces[2:]
 
 
 def get_best_model_dir(model_dir: Path) -> Tuple[Path, int]:
@@ -22,7 +22,8 @@ def load_config(exp_name: str) -> dict:
     config = _BASE_CONFIG.copy()
 
     with config_path.open("r", encoding="utf-8") as file:
-        loaded_config = yaml.safe_load(file)
+        # the libyaml loader is used when PyYAML was built with it
+        loaded_config = yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
         return merge_dict(config, loaded_config)
 
 
@@ -0,0 +1,173 @@
+import random
+from functools import reduce
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+
+from silnlp.common.corpus import (
+    combine_eval_frames,
+    combine_frames,
+    count_lines,
+    get_nonempty_line_mask,
+    sample_corpus_lines,
+    split_corpus,
+    write_unique_lines,
+)
+
+
+def write_lines(path: Path, text: str) -> Path:
+    path.write_bytes(text.encode("utf-8"))
+    return path
+
+
+def read_nonempty_line_mask(path: Path) -> List[bool]:
+    with path.open("r", encoding="utf-8") as file:
+        return [len(line.strip()) > 0 for line in file]
+
+
+def test_get_nonempty_line_mask(tmp_path: Path) -> None:
+    texts = [
+        "",
+        "a",
+        "a\n",
+        "a\n\n b \n\t\n",
+        "a\r\n\r\nb\r\n",
+        "\u00e9\n\u3000\n\u00a0 \n\u2028\nb\u3000\n\x1c\n",
+        "\n\n",
+    ]
+    for i, text in enumerate(texts):
+        path = write_lines(tmp_path / f"corpus{i}.txt", text)
+        assert get_nonempty_line_mask(path).tolist() == read_nonempty_line_mask(path), repr(text)
+
+
+def test_get_nonempty_line_mask_lone_cr(tmp_path: Path) -> None:
+    # lone carriage returns are line breaks when the file is read as text
+    for i, text in enumerate(["a\rb\n", "a\r\rb", "a\r\n\r", "\r"]):
+        path = write_lines(tmp_path / f"corpus{i}.txt", text)
+        assert get_nonempty_line_mask(path).tolist() == read_nonempty_line_mask(path), repr(text)
+    assert get_nonempty_line_mask(tmp_path / "corpus0.txt").tolist() == [True, True]
+
+
+def test_count_lines(tmp_path: Path) -> None:
+    for i, text in enumerate(["", "\ufeff", "a", "a\n", "\ufeffa\r\nb", "a\n\nb\n", "a\rb\r\n", "a\r"]):
+        path = write_lines(tmp_path / f"corpus{i}.txt", text)
+        with path.open("r", encoding="utf-8-sig") as file:
+            lines = file.readlines()
+        assert count_lines(path) == len(lines), repr(text)
+        assert count_lines(path, lambda line: len(line.strip()) > 0) == sum(1 for l in lines if len(l.strip()) > 0)
+
+
+def test_sample_corpus_lines(tmp_path: Path) -> None:
+    file1 = write_lines(tmp_path / "file1.txt", "".join(f"a{i}\n" if i % 3 != 0 else "\n" for i in range(100)))
+    file2 = write_lines(tmp_path / "file2.txt", "".join(f"b{i}\n" for i in range(50)) + "b50")
+    nonempty_lines = [f"a{i}\n" for i in range(100) if i % 3 != 0] + [f"b{i}\n" for i in range(51)]
+
+    sample = sample_corpus_lines([file1, file2], 40, 111)
+    assert sample is not None
+    assert len(sample) == 40
+    assert len(set(sample)) == 40
+    assert set(sample).issubset(nonempty_lines)
+    assert sample == [line for line in nonempty_lines if line in sample]
+    assert sample_corpus_lines([file1, file2], 40, 111) == sample
+
+
+def test_sample_corpus_lines_under_limit(tmp_path: Path) -> None:
+    file1 = write_lines(tmp_path / "file1.txt", "a\n\nb\n")
+    file2 = write_lines(tmp_path / "file2.txt", "c\n \n")
+    assert sample_corpus_lines([file1, file2], 3, 111) is None
+    assert sample_corpus_lines([file1, file2], 10, 111) is None
+
+
+def test_sample_corpus_lines_no_limit(tmp_path: Path) -> None:
+    # SentencePiece uses all of the sentences when the maximum training size is zero
+    file1 = write_lines(tmp_path / "file1.txt", "a\nb\nc\n")
+    assert sample_corpus_lines([file1], 0, 111) is None
+    assert sample_corpus_lines([file1], -1, 111) is None
+
+
+def test_write_unique_lines(tmp_path: Path) -> None:
+    file1 = write_lines(tmp_path / "file1.txt", "\ufeffa\nb \n\n c\na\n")
+    file2 = write_lines(tmp_path / "file2.txt", "c\nd\r\nb")
+    output_path = tmp_path / "unique.txt"
+    assert write_unique_lines([file1, file2], output_path) == 4
+    assert output_path.read_text(encoding="utf-8") == "a\nb\nc\nd\n"
+
+
+def combine_first_eval_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    return reduce(lambda combined, frame: combined.combine_first(frame).fillna(""), frames)
+
+
+def create_eval_frame(indices: List[int], trg_project: str, prefix: str) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "vref": [f"v{i}" for i in indices],
+            "source": [f"{prefix}s{i}" for i in indices],
+            f"target_{trg_project}": [f"{prefix}t{i}" for i in indices],
+        },
+        index=indices,
+    )
+
+
+def assert_same_values(combined: pd.DataFrame, expected: pd.DataFrame) -> None:
+    # the column order of combine_first() depends on the pandas version, so the values are compared separately
+    assert sorted(combined.columns) == sorted(expected.columns)
+    if pd.__version__.startswith("1."):
+        assert combined.columns.tolist() == expected.columns.tolist()
+    assert combined.index.tolist() == expected.index.tolist()
+    assert combined.to_dict() == expected[combined.columns].to_dict()
+
+
+def test_combine_eval_frames_same_axes() -> None:
+    frames = [create_eval_frame([3, 1, 2], "A", "x"), create_eval_frame([3, 1, 2], "A", "y")]
+    combined = combine_eval_frames(frames)
+    assert combined.index.tolist() == [3, 1, 2]
+    assert combined.columns.tolist() == ["vref", "source", "target_A"]
+    assert_same_values(combined, combine_first_eval_frames(frames))
+
+
+def test_combine_eval_frames_different_axes() -> None:
+    frames = [
+        create_eval_frame([5, 1, 3], "B", "x"),
+        create_eval_frame([2, 3], "A", "y"),
+        create_eval_frame([4, 1], "B", "z"),
+    ]
+    combined = combine_eval_frames(frames)
+    # pandas 1.x sorts the union of the axes when they differ
+    assert combined.index.tolist() == [1, 2, 3, 4, 5]
+    assert combined.columns.tolist() == ["source", "target_A", "target_B", "vref"]
+    assert combined.loc[3].tolist() == ["xs3", "yt3", "xt3", "v3"]
+    assert combined.loc[2].tolist() == ["ys2", "yt2", "", "v2"]
+    assert combined.loc[1].tolist() == ["xs1", "", "xt1", "v1"]
+    assert_same_values(combined, combine_first_eval_frames(frames))
+
+
+def test_combine_eval_frames_single_frame() -> None:
+    frame = create_eval_frame([2, 1], "A", "x")
+    assert combine_eval_frames([frame]) is frame
+
+
+def test_split_corpus_used_indices() -> None:
+    used_indices = {0, 3, 4, 5, 9, 17, 18, 49}
+    random.seed(111)
+    split = split_corpus(50, 20, used_indices)
+    random.seed(111)
+    expected = set(random.sample([i for i in range(50) if i not in used_indices], 20))
+    assert split == expected
+    assert split_corpus(50, 42, used_indices) is None
+
+
+def test_combine_frames() -> None:
+    frames: List[pd.DataFrame] = []
+    for src_project, trg_project, indices in [("A", "X", [1, 2]), ("B", "X", [2, 3]), ("A", "Y", [1, 3])]:
+        frame = create_eval_frame(indices, trg_project, "").rename(
+            columns={"source": f"source_{src_project}", f"target_{trg_project}": "target"}
+        )
+        frame.index = pd.MultiIndex.from_tuples([(trg_project, i) for i in indices], names=["trg_project", "index"])
+        frames.append(frame)
+    combined = combine_frames(frames)
+    # unlike combine_eval_frames(), missing cells of existing rows are filled by later frames
+    assert combined.loc[("X", 2)].to_dict() == {"source_A": "s2", "source_B": "s2", "target": "t2", "vref": "v2"}
+    assert combined.loc[("Y", 3)].to_dict() == {"source_A": "s3", "source_B": "", "target": "t3", "vref": "v3"}
+    assert combined.index.names == ["trg_project", "index"]
+    assert_same_values(combined, reduce(lambda combined, frame: combined.combine_first(frame), frames).fillna(""))
@@ -0,0 +1,49 @@
+import sys
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+import sentencepiece as sp
+
+from silnlp.nmt import utils
+from silnlp.nmt.utils import encode_sp, encode_sp_lines
+
+
+def train_sp_processor(tmp_path: Path) -> sp.SentencePieceProcessor:
+    corpus_path = tmp_path / "corpus.txt"
+    corpus_path.write_text("".join(f"word{i} other{i % 7} text{i % 13}\n" for i in range(500)), encoding="utf-8")
+    sp.SentencePieceTrainer.Train(
+        input=str(corpus_path), model_prefix=str(tmp_path / "sp"), vocab_size=30, minloglevel=2
+    )
+    return sp.SentencePieceProcessor(model_file=str(tmp_path / "sp.model"))
+
+
+def test_encode_sp_lines_threads(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    spp = train_sp_processor(tmp_path)
+    lines = [f"word{i} text{i % 11}" for i in range(400)]
+    expected = [encode_sp(spp, line) for line in lines]
+    # a cache smaller than two batches makes one thread evict the entries that the other thread is reading
+    monkeypatch.setattr(utils, "_ENCODE_BATCH_SIZE", 40)
+    monkeypatch.setattr(utils, "_ENCODE_CACHE_SIZE", 50)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    errors: List[BaseException] = []
+
+    def encode(offset: int) -> None:
+        try:
+            for _ in range(5):
+                shifted = lines[offset:] + lines[:offset]
+                assert list(encode_sp_lines(spp, shifted)) == expected[offset:] + expected[:offset]
+        except BaseException as e:
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=encode, args=(offset,)) for offset in (0, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
@@ -1,6 +1,7 @@
 import pytest
 import shutil
 import os
+from pathlib import Path
 import sentencepiece as sp
 from . import helper
 from silnlp.nmt.config import load_config
@@ -12,18 +13,17 @@ SIL_NLP_ENV.set_data_dir()
 SIL_NLP_ENV.mt_experiments_dir = SIL_NLP_ENV.mt_dir / "temp_experiments"
 SIL_NLP_ENV.mt_experiments_dir.mkdir(exist_ok=True)
 exp_truth_dir = SIL_NLP_ENV.mt_dir / "Experiments"
-exp_subdirs = [folder for folder in exp_truth_dir.glob("*/")]
+exp_subdirs = sorted(Path(entry.path) for entry in os.scandir(exp_truth_dir) if entry.is_dir())
 
 
 @pytest.mark.parametrize("exp_folder", exp_subdirs)
 def test_preprocess(exp_folder):
-    exp_truth_path = os.path.join(exp_truth_dir, exp_folder)
-    config_file = os.path.join(exp_truth_path, "config.yml")
-    assert os.path.isfile(config_file), "The configuration file config.yml does not exist for " + exp_folder.name
+    config_file = exp_folder / "config.yml"
+    assert config_file.is_file(), "The configuration file config.yml does not exist for " + exp_folder.name
     experiment_path = SIL_NLP_ENV.mt_experiments_dir / exp_folder.name
     shutil.rmtree(experiment_path, ignore_errors=True)
     os.makedirs(experiment_path, exist_ok=True)
-    shutil.copyfile(src=config_file, dst=os.path.join(experiment_path, "config.yml"))
+    shutil.copyfile(src=config_file, dst=experiment_path / "config.yml")
     helper.init_file_logger(str(experiment_path))
 
     sp.set_random_generator_seed(111)  # this is to make the vocab generation consistent
@@ -31,4 +31,4 @@ def test_preprocess(exp_folder):
     config.set_seed()
     config.preprocess(stats=False)
 
-    helper.compare_folders(truth_folder=exp_truth_path, computed_folder=experiment_path)
+    helper.compare_folders(truth_folder=str(exp_folder), computed_folder=str(experiment_path))
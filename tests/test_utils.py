@@ -0,0 +1,49 @@
+import logging
+import threading
+from typing import Iterator
+
+import pytest
+
+from silnlp.common.utils import log_elapsed, prefetch
+
+
+def test_prefetch() -> None:
+    for count in [0, 1, 999, 1000, 1001, 5432]:
+        assert list(prefetch(range(count))) == list(range(count))
+    assert list(prefetch(iter("abcdefg"), chunk_size=2, max_chunks=1)) == list("abcdefg")
+
+
+def test_prefetch_error() -> None:
+    def items() -> Iterator[int]:
+        yield from range(5)
+        raise ValueError("read failed")
+
+    results = []
+    with pytest.raises(ValueError, match="read failed"):
+        for item in prefetch(items(), chunk_size=2):
+            results.append(item)
+    assert results == [0, 1, 2, 3]
+
+
+def test_prefetch_close() -> None:
+    thread_count = threading.active_count()
+    it = prefetch(iter(range(1000000)), chunk_size=10, max_chunks=2)
+    assert next(it) == 0
+    it.close()
+    # the producer thread stops even though the queue was full
+    assert threading.active_count() == thread_count
+
+
+def test_log_elapsed(caplog: pytest.LogCaptureFixture) -> None:
+    logger = logging.getLogger("test_log_elapsed")
+    with caplog.at_level(logging.INFO, logger="test_log_elapsed"):
+        with pytest.raises(ValueError):
+            with log_elapsed(logger, "failing"):
+                raise ValueError()
+        with log_elapsed(logger, "vocabs"):
+            pass
+    assert [record.getMessage().split(" ")[0] for record in caplog.records] == ["phase=failing", "phase=vocabs"]
+    for record in caplog.records:
+        fields = record.getMessage().split(" ")
+        assert fields[1].startswith("elapsed=")
+        assert fields[2].startswith("cpu=")